@@ -12,12 +12,56 @@ authors:
 #
 # Importing modules
 #
+import argparse
+import bz2
+import fnmatch
+import gzip
+import hashlib
+import io
+import json
+import lzma
 import math
+import mmap
+import os
+import re
+import sqlite3
 import sys
+import tarfile
+import tempfile
+import zipfile
 import platform
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import lru_cache, partial
 from pathlib import Path
 import numpy as np
 import time
+import zlib
+
+# Optional: zstandard is only needed to read .zst files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Optional: scipy is only needed for the exact Voigt profile (Faddeeva
+# function); without it, the rational approximation of faddeeva is used
+try:
+    from scipy.special import wofz
+except ImportError:
+    wofz = None
+
+# Optional: numexpr and Numba are only needed for the multithreaded
+# backends of the gaussian broadening (GAUSSIAN_BACKENDS)
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 #
 # Constants
@@ -27,6 +71,127 @@ FACT1 = 1.0E7
 FACT2 = 1.0E0
 SIGMA = 3099.6
 
+# Lorentzian: half width at half maximum (eV) and conversion of eV to cm-1.
+# The default is the half width at half maximum of the gaussian above.
+EV_TO_CM = 8065.544
+LORENTZIAN_HWHM = 0.333
+
+# Width (eV) of the gaussian above, FACT1/SIGMA cm-1 (1/e half width), and
+# fraction of the lorentzian in the pseudo-Voigt line shape.
+GAUSSIAN_WIDTH = FACT1 / SIGMA / EV_TO_CM
+PSEUDO_VOIGT_ETA = 0.5
+
+# Support of the line shapes of the registry (LINE_SHAPES): distance where
+# the line falls below this fraction of its peak.
+LINE_SUPPORT_TOLERANCE = 1.0E-6
+
+# Terms of the rational approximation of the Faddeeva function (no scipy).
+FADDEEVA_TERMS = 32
+
+# Gaussian writes the termination message in the last lines of the log, so
+# only this many bytes at the end of the file are read to verify it.
+TAIL_BLOCK_SIZE = 8192
+
+# l914 section and the "Excited State" records, searched directly in the bytes
+# of the log (mmap), without decoding and splitting each line. The section is
+# recognized by the link number, whatever the installation path of Gaussian
+# ("(Enter /scr/programs/g09/l914.exe)", "(Enter C:\G16W\l914.exe)", ...).
+L914_EXE = b"l914.exe)"
+RE_L914_ENTER = re.compile(rb"\(Enter [^()\r\n]*l914\.exe\)")
+RE_L914_LEAVE = re.compile(rb"Leave Link\s+914\b")
+RE_EXCITED_STATE = re.compile(rb"Excited State\s+\d+:\s+\S+\s+\S+\s+eV\s+(\S+)\s+nm\s+f=(\S+)")
+
+# Complete records of the Gaussian excited states (parse_gaussian_states). The
+# orbital contributions below each "Excited State" line are not parsed: only
+# the byte offset of the first of them is kept, and read_transitions reads
+# them when they are requested.
+RE_EXCITED_STATE_RECORD = re.compile(rb"Excited State\s+(\d+):[ \t]+(\S+)[ \t]+(\S+)[ \t]+eV[ \t]+"
+                                     rb"(\S+)[ \t]+nm[ \t]+f=(\S+)(?:[ \t]+<S\*\*2>=(\S+))?[^\n]*\n?")
+RE_TRANSITION = re.compile(rb"^\s*(\d+[AB]?)\s*(->|<-)\s*(\d+[AB]?)\s+(-?\d+\.\d*)\s*$")
+GAUSSIAN_STATE_DTYPE = np.dtype([("state", np.int64), ("energy", np.float64),
+                                 ("wavelength", np.float64), ("strength", np.float64),
+                                 ("multiplicity", "U16"), ("symmetry", "U16"),
+                                 ("s2", np.float64), ("offset", np.int64)])
+TRANSITION_DTYPE = np.dtype([("occupied", "U8"), ("direction", "U2"), ("virtual", "U8"),
+                             ("coefficient", np.float64)])
+
+# Absorption tables of Orca: title of the section and rows of the table, as
+# written by Orca 4/5 ("1  21456.1  466.1  0.0123 ...", SOC tables with two
+# state columns) and by Orca 6 ("0-1A  ->  1-1A  2.66  21456.1  466.1  0.0123 ...").
+RE_ORCA_SECTION = re.compile(rb"^\s*(SOC CORRECTED )?ABSORPTION SPECTRUM VIA TRANSITION "
+                             rb"(ELECTRIC|VELOCITY) DIPOLE MOMENTS\s*$")
+RE_ORCA_ROW = re.compile(rb"^\s*(?:\d+\s+)?(\d+)\s+(-?\d+\.\d*)\s+(-?\d+\.\d*)\s+"
+                         rb"(-?\d+\.\d*(?:[eE][-+]?\d+)?)\s")
+RE_ORCA6_ROW = re.compile(rb"^\s*\S+\s+->\s+(\d+)\S*\s+-?\d+\.\d*\s+(-?\d+\.\d*)\s+"
+                          rb"(-?\d+\.\d*)\s+(-?\d+\.\d*(?:[eE][-+]?\d+)?)\s")
+ORCA_STATE_DTYPE = np.dtype([("state", np.int64), ("energy", np.float64),
+                             ("wavelength", np.float64), ("strength", np.float64)])
+ORCA_REPRESENTATIONS = ("electric", "velocity", "soc_electric", "soc_velocity")
+
+# Extracted excited states: binary (ragged arrays) and text formats.
+INPUT_NPZ = "input.npz"
+INPUT_DAT = "input.dat"
+
+# Memory (bytes) of the temporary arrays used to broaden the spectra at a
+# time; the states x wavenumbers terms are evaluated in tiles of this size.
+# Tiles of a few MB stay in the CPU cache and are as fast as larger ones.
+MAX_BROADEN_BYTES = 8 * 1024 * 1024
+
+# Backends of the gaussian broadening: the one given by this environment
+# variable is used, otherwise the fastest one, measured once per machine
+# and kept in this file (in the home directory).
+BACKEND_ENV = "LAQC_BACKEND"
+BACKEND_FILE = ".laqc_backend.json"
+
+# Kernel of the gaussian: exp of every term, or linear interpolation in a
+# table of exp(-x**2) with this many points per width, up to this many widths.
+GAUSSIAN_MODES = ("exp", "table")
+TABLE_POINTS_PER_WIDTH = 1024
+TABLE_CUTOFF = 6.0
+
+# Wavenumbers of each block of the grid in the windowed (truncated) broadening.
+WINDOW_BLOCK_SIZE = 128
+
+# FFT engine: bins of the uniform grid per width of the line shape, and
+# distance (in widths) beyond which the transitions are left out.
+FFT_BINS_PER_WIDTH = 32
+FFT_GAUSSIAN_CUTOFF = 8.0
+BROADENING_ENGINES = ("direct", "fft")
+
+# Precision of the direct broadening and of the average: float32 halves the
+# memory (and its bandwidth) of the terms, with a compensated average.
+PRECISIONS = ("float64", "float32")
+
+# Parsed files are kept in this SQLite database, in the directory of the data.
+# The version of the parsers is part of the key of each record: increase it
+# whenever the result of a parser changes, so the old records are not used
+# (2: l914 section of any Gaussian install path; 3: termination messages
+# inside an l914 section of compressed logs and archives).
+CACHE_FILE = ".laqc_cache.sqlite"
+PARSER_VERSION = 3
+
+# Files are hashed (ParseCache with use_hash) in blocks of this size.
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Compressed logs are skipped forward (read_transitions) in blocks of this size.
+SKIP_BLOCK_SIZE = 1024 * 1024
+
+# Compressed outputs are read directly (as a stream) with these extensions.
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".bz2", ".zst")
+
+# Errors of a compressed stream without its end (a log still being written
+# or truncated) or with corrupted data.
+DECOMPRESSION_ERRORS = (EOFError, zlib.error, lzma.LZMAError, gzip.BadGzipFile)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+# Errors of reading a log that is still being written or was removed after
+# it was listed.
+LOG_READ_ERRORS = (OSError,) + DECOMPRESSION_ERRORS
+
+# Ensembles of outputs packed in one file (read as a stream, member by member).
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+
 
 def head_msg():
     """
@@ -129,7 +294,7 @@ def questions(type_of_fit, type_of_average, wave_numbers,
     Parameters
     ----------
     type_of_fit : str
-        Type of adjustment. (gaussian).
+        Type of adjustment (a line shape of LINE_SHAPES).
     type_of_average : str
         Type of average that will used in the generation of resumen graph.
     wave_numbers : array
@@ -142,10 +307,10 @@ def questions(type_of_fit, type_of_average, wave_numbers,
     tyoe_of_fit, type_of_average, wave_numbers, wave_numbers_interval.
 
     """
-    val = input("Type of adjustment (gaussian or lorentzian) "
+    val = input(f"Type of adjustment ({', '.join(LINE_SHAPES)}) "
                 "[gaussian]".ljust(57, ".") + ": ").strip()
     if val != "":
-        if val in ['gaussian', 'lorentzian']:
+        if val in LINE_SHAPES:
             type_of_fit = val
         else:
             if val == "exit":
@@ -199,60 +364,377 @@ def questions(type_of_fit, type_of_average, wave_numbers,
     return type_of_fit, type_of_average, wave_numbers, wave_numbers_interval
 
 
-def get_files(local, file_type=".log"):
+def get_files(local, file_type=".log", recursive=False, include=None, exclude=None,
+              walkers=1):
     """
     Get all files in the specified directory with a type of extension.
 
+    Compressed files (for example, .log.gz and .log.xz) are also found. The
+    directory is listed with os.scandir (see scan_files), so the type of each
+    entry comes from the listing, without a stat per file.
+
+    Parameters
+    ----------
+    local : str
+        Directory of the files.
+    file_type : str
+        Extension (.log, .out).
+    recursive : bool
+        Also search the subdirectories (for example, run_*/frame_*.log).
+    include : list
+        Glob patterns of the relative path; only matching files are returned.
+    exclude : list
+        Glob patterns of the relative path of files and directories skipped.
+    walkers : int
+        Number of directories listed at the same time (threads).
+
     Returns
     -------
     list_files : array
-       Return a list of names with all found files in the specified directory.
+       Return a list of names (relative to [local]) with all found files in
+       the specified directory, sorted.
 
     """
-    list_files = []
+    return scan_files(local, file_type, recursive, include, exclude, walkers)
+
+
+def matches_glob(name, patterns):
+    """
+    Verify if a relative path matches one of the glob patterns.
 
-    path = Path(local)
+    Parameters
+    ----------
+    name : str
+        Relative path, with "/" as separator.
+    patterns : list
+        Glob patterns (fnmatch), for example "run_*/frame_*.log".
 
-    # List of all files with extension specified in [file_type] parameter.
-    list_files = [log_file.name for log_file in path.iterdir()
-                  if log_file.is_file() if log_file.suffix == file_type]
+    Returns
+    -------
+    Bool
+        True if the path or its last component matches one of the patterns.
 
-    return list_files
+    """
+    base_name = name.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(base_name, pattern)
+               for pattern in patterns)
 
 
-def get_files_gaussian(local, file_type=".log"):
+def scan_directory(directory, prefix, file_type, include, exclude):
     """
-    Get all files in the specified directory with a type of extension.
+    List one directory with os.scandir.
 
-    After finding the file, verify the existence of the expression [Normal termination] in the file log.
+    The types of the entries come from the listing (DirEntry caches them),
+    so no stat is done for regular files and directories.
+
+    Parameters
+    ----------
+    directory : str
+        Directory listed.
+    prefix : str
+        Relative path of the directory, with "/" at the end ("" for the top).
+    file_type : str
+        Extension (.log, .out).
+    include : list
+        Glob patterns of the files returned (None, all).
+    exclude : list
+        Glob patterns of the files and directories skipped (None, none).
 
     Returns
     -------
-    list_files : array
-        Return a list of names with all found files in the specified directory.
+    list_files : list
+        Relative paths of the files found.
+    list_dirs : list
+        Pairs (path, relative path) of the subdirectories.
 
     """
     list_files = []
+    list_dirs = []
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not (exclude and matches_glob(name, exclude)):
+                    list_dirs.append((entry.path, name + "/"))
+            elif has_file_type(entry.name, file_type) and entry.is_file():
+                if include and not matches_glob(name, include):
+                    continue
+                if exclude and matches_glob(name, exclude):
+                    continue
+                list_files.append(name)
+
+    return list_files, list_dirs
+
+
+def scan_files(local, file_type=".log", recursive=False, include=None, exclude=None,
+               walkers=1):
+    """
+    Find the files with a type of extension in a directory tree.
+
+    With more than one walker, the subdirectories are listed in parallel by
+    threads (os.scandir releases the GIL while waiting for the file system),
+    which hides the latency of network file systems (NFS).
+
+    Parameters
+    ----------
+    local : str
+        Directory of the files.
+    file_type : str
+        Extension (.log, .out).
+    recursive : bool
+        Also search the subdirectories.
+    include : list
+        Glob patterns of the relative path of the files returned.
+    exclude : list
+        Glob patterns of the relative path of the files and directories skipped.
+    walkers : int
+        Number of directories listed at the same time.
+
+    Returns
+    -------
+    list_files : list
+        Relative paths of the files found ("/" as separator), sorted.
+
+    """
+    list_files, pending = scan_directory(local, "", file_type, include, exclude)
+    if not recursive:
+        return sorted(list_files)
+
+    if walkers is None or walkers <= 1:
+        while pending:
+            directory, prefix = pending.pop()
+            files, dirs = scan_directory(directory, prefix, file_type, include, exclude)
+            list_files.extend(files)
+            pending.extend(dirs)
+        return sorted(list_files)
+
+    with ThreadPoolExecutor(max_workers=walkers) as executor:
+        running = {executor.submit(scan_directory, directory, prefix, file_type,
+                                   include, exclude)
+                   for directory, prefix in pending}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                list_files.extend(files)
+                running.update(executor.submit(scan_directory, directory, prefix, file_type,
+                                               include, exclude)
+                               for directory, prefix in dirs)
+
+    return sorted(list_files)
+
+
+def has_file_type(name, file_type=".log"):
+    """
+    Verify if a file has a type of extension, compressed or not.
+
+    Parameters
+    ----------
+    name : str
+        Name of the file.
+    file_type : str
+        Extension (.log, .out).
+
+    Returns
+    -------
+    Bool
+        True for [file_type] and [file_type] followed by one of COMPRESSED_SUFFIXES.
+
+    """
+    return name.endswith(file_type) or \
+        any(name.endswith(file_type + suffix) for suffix in COMPRESSED_SUFFIXES)
+
+
+def is_compressed(local_log):
+    """
+    Verify if a file is compressed (by its extension).
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the file.
+
+    Returns
+    -------
+    Bool
+        True if the extension is one of COMPRESSED_SUFFIXES.
+
+    """
+    return str(local_log).endswith(COMPRESSED_SUFFIXES)
+
+
+def open_log(local_log):
+    """
+    Open a log file for reading (bytes), decompressing it on the fly if necessary.
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the file and the path where it is located.
+
+    Returns
+    -------
+    f_log : file object
+        Binary stream with the (decompressed) content of the file.
+
+    """
+    local_log = str(local_log)
+    if local_log.endswith(".gz"):
+        return gzip.open(local_log, "rb")
+    if local_log.endswith(".xz"):
+        return lzma.open(local_log, "rb")
+    if local_log.endswith(".bz2"):
+        return bz2.open(local_log, "rb")
+    if local_log.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"the module zstandard is necessary to read {local_log}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(local_log, "rb"),
+                                                                            closefd=True))
+
+    return open(local_log, "rb")
+
+
+def decompress_stream(f_raw, name):
+    """
+    Decompress on the fly a binary stream, according to the extension of its name.
+
+    Parameters
+    ----------
+    f_raw : file object
+        Binary stream (for example, a member of a tar or zip file).
+    name : str
+        Name of the file, used to identify the compression.
+
+    Returns
+    -------
+    f_log : file object
+        Binary stream with the decompressed content ([f_raw] if not compressed).
+
+    """
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=f_raw, mode="rb")
+    if name.endswith(".xz"):
+        return lzma.LZMAFile(f_raw, "rb")
+    if name.endswith(".bz2"):
+        return bz2.BZ2File(f_raw, "rb")
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"the module zstandard is necessary to read {name}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f_raw))
+
+    return f_raw
+
+
+def is_archive(local):
+    """
+    Verify if a path is a tar or zip file with an ensemble of outputs.
+
+    Parameters
+    ----------
+    local : str
+        Path informed by the user.
+
+    Returns
+    -------
+    Bool
+        True if [local] is a file with one of ARCHIVE_SUFFIXES.
+
+    """
+    return local.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(local)
+
+
+def iter_archive(archive, file_type=".log"):
+    """
+    Iterate over the members of a tar or zip file with a type of extension.
+
+    The archive is read only once and sequentially: a tar file is opened as
+    a stream and the members of a zip file are visited in the order they
+    are stored. Each member must be read before the next one is requested.
+
+    Parameters
+    ----------
+    archive : str
+        Name of the tar (.tar, .tar.gz, ...) or zip file.
+    file_type : str
+        Extension of the members (compressed or not, see has_file_type).
+
+    Yields
+    ------
+    name : str
+        Name of the member.
+    f_log : file object
+        Binary stream with the (decompressed) content of the member.
+
+    """
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as f_zip:
+            members = sorted(f_zip.infolist(), key=lambda info: info.header_offset)
+            for info in members:
+                if not info.is_dir() and has_file_type(info.filename, file_type):
+                    with f_zip.open(info) as f_member:
+                        yield info.filename, decompress_stream(f_member, info.filename)
+    else:
+        with tarfile.open(archive, "r|*") as f_tar:
+            for member in f_tar:
+                if member.isfile() and has_file_type(member.name, file_type):
+                    yield member.name, decompress_stream(f_tar.extractfile(member), member.name)
+
+
+def read_archive(archive, file_type, parser):
+    """
+    Extract the excited states of all the outputs in a tar or zip file.
+
+    Parameters
+    ----------
+    archive : str
+        Name of the tar or zip file.
+    file_type : str
+        Extension of the outputs (.log, .out).
+    parser : function
+        Function that reads a binary stream (parse_gaussian_stream or parse_orca_stream).
+
+    A truncated or corrupted archive is read until the error (the members
+    read completely are returned).
 
-    path = Path(local)
+    Returns
+    -------
+    list_log : list
+        Names of the members that were read.
+    results : list
+        (wavelengths, strengths, founded) of each member.
 
-    # List of all files with extension specified in [file_type] parameter.
-    for log_file in path.iterdir():
-        if log_file.is_file() and log_file.suffix == file_type:
-            if normal_termination(log_file):
-                list_files.append(log_file.name)
+    """
+    list_log = []
+    results = []
+    try:
+        for name, f_log in iter_archive(archive, file_type):
+            result = parser(f_log)
+            list_log.append(name)
+            results.append(result)
+    except (tarfile.TarError, zipfile.BadZipFile) + DECOMPRESSION_ERRORS as msg_err:
+        # Truncated archive: the members read completely are kept
+        print(f" + {archive} incompleto ({msg_err}), {len(list_log)} arquivo(s) lido(s)")
 
-    return list_files
+    return list_log, results
 
 
-def normal_termination(local_log):
+def normal_termination(local_log, tail_size=TAIL_BLOCK_SIZE):
     """
     Verify the existence of the expression [Normal termination] in the file log.
 
+    Only a block of [tail_size] bytes at the end of the file is read. The
+    last termination message of the block decides, so a Link1 job whose
+    first step ended normally and the second one failed is rejected. Any
+    version of Gaussian (03, 09, 16, ...) is recognized. A compressed file
+    can not be read from the end, so it is read (decompressed) completely.
+
     Parameters
     ----------
     local_log : str
         Name of the log file and the path where it is located.
+    tail_size : int
+        Number of bytes read from the end of the file.
 
     Returns
     -------
@@ -260,388 +742,3565 @@ def normal_termination(local_log):
         True if the expression [Normal termination] was founded, or false otherwise..
 
     """
-    founded = False
-    with open(local_log) as f_file:
-        for line in f_file:
-            if "Normal termination of Gaussian 09" in line:
-                founded = True
+    if is_compressed(local_log):
+        with open_log(local_log) as f_log:
+            return parse_gaussian_stream(f_log)[2]
+
+    with open(local_log, "rb") as f_file:
+        f_file.seek(0, 2)
+        f_file.seek(max(0, f_file.tell() - tail_size))
+        tail = f_file.read()
+
+    return tail_normal_termination(tail)
+
+
+def tail_normal_termination(tail):
+    """
+    Verify if the last termination message in a block of bytes is [Normal termination].
+
+    Parameters
+    ----------
+    tail : bytes
+        Last bytes of the log file.
+
+    Returns
+    -------
+    founded : bool
+        True if the expression [Normal termination] was founded, or false otherwise.
+
+    """
+    pos = tail.rfind(b" termination ")
+    founded = pos >= 0 and tail[max(0, pos - 6):pos] == b"Normal" and \
+        tail.startswith(b" of Gaussian", pos + len(b" termination"))
 
     return founded
 
 
-def extract_data_orca():
+def last_l914_block(data):
     """
-    Extract data about excited states in Orca files and create a file name "input.dat".
+    Locate the last l914 section of a Gaussian log by its byte offsets.
+
+    The section is searched from the end of the file backwards, and its end
+    is the following "Leave Link 914", so only the last section (and what
+    comes after it) is visited, however many TD steps the job has.
+
+    Parameters
+    ----------
+    data : bytes or mmap.mmap
+        Content of the log.
 
     Returns
     -------
-    None.
+    start, end : tuple
+        Byte offsets of the beginning and the end of the section, or None
+        if the log has no l914 section.
 
     """
-    excited_states = []
-    list_num_excited_state = []
+    pos = len(data)
+    while True:
+        pos = data.rfind(L914_EXE, 0, pos)
+        if pos < 0:
+            return None
 
-    try:
-        local_files = input("Local of files".ljust(57, ".") + ": ").strip()
-        if local_files.strip() != "":
-            if local_files[-1] != get_separator():
-                local_files = local_files + get_separator()
-
-            if file_exist(local_files):
-                list_log = get_files(local_files, '.out')
-
-                for log in list_log:
-                    local_log = local_files + log
-                    print(f" - Extract excited states from the file: {log}")
-                    num_excited_state = 0
-                    with open(local_log, 'r', encoding='utf-8') as f_arquivo:
-                        section_founded = False
-
-                        for line in f_arquivo:
-                            txt_line = line.strip()
-                            if txt_line.startswith("ABSORPTION SPECTRUM VIA "
-                                                   "TRANSITION ELECTRIC "
-                                                   "DIPOLE MOMENTS"):
-                                section_founded = True
-                            else:
-                                if len(txt_line) == 0 and section_founded:
-                                    break
-
-                            if section_founded:
-                                resto = []
-                                for i in txt_line.split(" "):
-                                    if i != "":
-                                        resto.append(i)
-
-                                try:
-                                    int(resto[0])
-                                    num_excited_state = num_excited_state + 1
-                                    comprimento_onda = resto[2]
-                                    forca_oscilador = resto[3]
-                                    excited_states.append([comprimento_onda,
-                                                           forca_oscilador])
-                                except ValueError:
-                                    continue
-                        list_num_excited_state.append(num_excited_state)
-                        f_arquivo.close()
-
-                # Saving data
-                f_input = open("input.dat", "w")
-
-                # Total number of structures
-                f_input.write(f"{len(list_log):<4d}\n")
-
-                # Total number of excited states founded in which structure.
-                val_num_excited_state = " ".join(str(i) for i in
-                                                 list_num_excited_state)
-                f_input.write(f"{val_num_excited_state}\n")
-
-                # Valores de número de onda e força do oscilador
-                for item in excited_states:
-                    valor_itens = "  ".join(str(i) for i in item)
-                    f_input.write(f"{valor_itens}\n")
-                f_input.close()
-                print("")
-    except OSError as msg_err:
-        print(f" + Erro: {msg_err}")
+        line_start = data.rfind(b"\n", 0, pos) + 1
+        match = RE_L914_ENTER.search(data, line_start, pos + len(L914_EXE))
+        if match:
+            break
+
+    leave = RE_L914_LEAVE.search(data, match.end())
+    end = leave.start() if leave else len(data)
+
+    return match.start(), end
 
 
-def extract_data_gaussian():
+def parse_gaussian_log_mmap(local_log):
     """
-    Extraindo dados de estados excitados no arquivo de saída do Gaussian.
+    Extract the excited states of a Gaussian log through a memory map of the file.
+
+    The l914 section and the "Excited State" records are found with a bytes
+    regular expression over the mapped file, and the values go straight to
+    float64 arrays, without building a string for each line. In jobs with
+    several steps (opt+TD), the last l914 section is used (see
+    last_l914_block) and nothing after its end is read.
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the log file and the path where it is located.
 
     Returns
     -------
-    None.
+    wavelengths : numpy.ndarray
+        Wavelengths (nm) of the excited states.
+    strengths : numpy.ndarray
+        Oscillator strengths of the excited states.
+    founded : bool
+        True if the expression [Normal termination] was founded, or false otherwise.
 
     """
-    excited_states = []
-    list_num_excited_state = []
+    wavelengths = np.empty(0)
+    strengths = np.empty(0)
 
-    try:
-        local_files = input("Local dos arquivos".ljust(57, ".") + ": ").strip()
-        if local_files.strip() != "":
-            if local_files[-1] != get_separator():
-                local_files = local_files + get_separator()
+    with open(local_log, "rb") as f_arquivo:
+        if os.fstat(f_arquivo.fileno()).st_size == 0:
+            return wavelengths, strengths, False
 
-            if file_exist(local_files):
-                list_log = get_files_gaussian(local_files, '.log')
+        with mmap.mmap(f_arquivo.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            founded = tail_normal_termination(data[-TAIL_BLOCK_SIZE:])
 
-                # Extraindo dados
-                print(" - Extraindo dados...")
-                for log in list_log:
-                    local_log = local_files + log
-                    print(f" - Extraindo estado excitado do arquivo: {log}")
-                    time.sleep(0.400)
-                    num_excited_state = 0
-                    with open(local_log, "r") as f_arquivo:
-                        secao_encontrada = False
-
-                        for line in f_arquivo:
-                            txt_linha = line.strip()
-
-                            if txt_linha.startswith("(Enter /scr/programs/g09/l914.exe)"):
-                                secao_encontrada = True
-                            else:
-                                if txt_linha.startswith("Leave Link") and secao_encontrada:
-                                    break
-
-                            if secao_encontrada:
-                                if txt_linha.startswith("Excited State"):
-                                    num_excited_state = num_excited_state + 1
-
-                                    # restante da linha
-                                    restante = txt_linha.split(":")[1]
-
-                                    resto = []
-                                    for i in restante.split(" "):
-                                        if i != "":
-                                            resto.append(i)
-                                    comprimento_onda = resto[3]
-                                    forca_oscilador = resto[5].replace("f=", "")
-                                    excited_states.append([comprimento_onda, forca_oscilador])
-
-                        list_num_excited_state.append(num_excited_state)
-                        f_arquivo.close()
-
-                # Saving data
-                f_input = open("input.dat", "w")
-                f_input.write(f"{len(list_log):<4d}\n")
-                f_input.write(f'{" ".join(str(i) for i in list_num_excited_state)}\n')
-                for item in excited_states:
-                    f_input.write(f'{"  ".join(str(i) for i in item)}\n')
-                f_input.close()
-                print("")
-            else:
-                print(" + Caminho não existe. Saindo!")
-                sys.exit()
+            block = last_l914_block(data)
+            if block is None:
+                return wavelengths, strengths, founded
 
-        else:
-            print(" + Caminho não informado. Saindo!")
-            sys.exit()
-    except OSError as msg_err:
-        print(f" + Erro: {msg_err}")
+            values = RE_EXCITED_STATE.findall(data, *block)
+
+    if values:
+        values = np.array(values, dtype=bytes).astype(np.float64)
+        wavelengths = values[:, 0]
+        strengths = values[:, 1]
 
+    return wavelengths, strengths, founded
 
-def fit_gaussian(type_of_average, wave_numbers):
+
+def parse_gaussian_stream(f_log):
     """
-    Ajuste gaussian.
+    Extract the excited states of a Gaussian log read as a stream of bytes.
+
+    Used for compressed logs, which can not be mapped in memory: the
+    stream is read once, the "Excited State" records are taken from the
+    last l914 section (a new section replaces the states of the previous
+    one) and the last termination message gives the status. A stream that
+    ends before its end (a compressed log still being written or truncated,
+    DECOMPRESSION_ERRORS) is a job without termination: founded is False.
 
     Parameters
     ----------
-    type_of_average : TYPE
-        DESCRIPTION.
-    wave_numbers : TYPE
-        DESCRIPTION.
+    f_log : file object
+        Binary stream with the content of the log (see open_log).
 
     Returns
     -------
-    None.
+    wavelengths : numpy.ndarray
+        Wavelengths (nm) of the excited states.
+    strengths : numpy.ndarray
+        Oscillator strengths of the excited states.
+    founded : bool
+        True if the expression [Normal termination] was founded, or false otherwise.
 
     """
-    average = {}
-    dados_spectrum = []
+    values = []
+    founded = False
+    secao_encontrada = False
+    secao_terminada = False
 
     try:
-        f_spectrum_gaussian = open("spectrum_gaussian.dat", "w")
-
-        with open("input.dat", "r") as f_input:
-            # m_valor representa a quantidade de estruturas que terão os espectros UV-VIS calculados
-            m_valor = int(f_input.readline())
-            # n_valor representa a quantidade de estados excitados para cada estrutura
-            n_valor = [int(i) for i in f_input.readline().split(" ")]
-
-            maxn = max(n_valor)
-            eigenvalue = [[0.0]*maxn for i in np.arange(0, m_valor)]
-            strength = [[0.0]*maxn for i in np.arange(0, m_valor)]
-
-            for j in range(0, m_valor):
-                for i in range(0, n_valor[j]):
-                    read_line = f_input.readline()
-                    if (read_line.strip()) != "":
-                        values = [float(i) for i in read_line.split("  ")]
-                        # Comprimento de onda
-                        eigenvalue[j][i] = values[0]
-                        # Força do oscilador
-                        strength[j][i] = values[1]
-        f_input.close()
-
-        for j in range(0, m_valor):
-            for nm_valor in wave_numbers:
-                spectrum = 0.0
-                for i in range(0, n_valor[j]):
-                    if type_of_average == 'aritmética':
-                        vlr_spectrum = A * (strength[j][i] / (FACT1/SIGMA)) * \
-                            math.exp(-(((1.0/nm_valor) - (1.0/eigenvalue[j][i]))/(FACT2/SIGMA))**2)
-                        spectrum = spectrum + vlr_spectrum
-
-                # Registra os valores calculados para cada número de onda
-                # para depois calcular desvio padrão e erro
-                dados_spectrum.append([nm_valor, spectrum])
-                f_spectrum_gaussian.write(f"{nm_valor:<4f}   {spectrum:>6.10f}\n")
-
-                if nm_valor in average:
-                    average[nm_valor] = average[nm_valor] + spectrum
-                else:
-                    average[nm_valor] = spectrum
+        for line in f_log:
+            # A termination message counts even inside an open l914 section
+            # (a job that died in l914 leaves the section open)
+            if b" termination " in line:
+                founded = tail_normal_termination(line)
+
+            if secao_encontrada and not secao_terminada:
+                if b"Excited State" in line:
+                    match = RE_EXCITED_STATE.search(line)
+                    if match:
+                        values.append(match.groups())
+                elif RE_L914_LEAVE.search(line):
+                    secao_terminada = True
+            elif L914_EXE in line and RE_L914_ENTER.search(line):
+                values = []
+                secao_encontrada = True
+                secao_terminada = False
+    except DECOMPRESSION_ERRORS:
+        founded = False
+
+    wavelengths = np.empty(0)
+    strengths = np.empty(0)
+    if values:
+        values = np.array(values, dtype=bytes).astype(np.float64)
+        wavelengths = values[:, 0]
+        strengths = values[:, 1]
+
+    return wavelengths, strengths, founded
+
+
+def parse_gaussian(local_log):
+    """
+    Extract the excited states of a Gaussian log, compressed or not.
 
-            f_spectrum_gaussian.write("\n")
+    Plain files are read through a memory map (parse_gaussian_log_mmap) and
+    compressed files as a stream (parse_gaussian_stream).
 
-        f_spectrum_gaussian.close()
-        print("")
-        print("Aquivo spectrum_gaussian.dat gerado!")
+    Parameters
+    ----------
+    local_log : str
+        Name of the log file and the path where it is located.
 
-        # Calculating and saving average
-        if type_of_average == 'aritmética':
-            for key in average.keys():
-                average[key] = average[key] / m_valor
+    Returns
+    -------
+    wavelengths, strengths, founded : tuple
+        See parse_gaussian_log_mmap.
 
-        with open("average_spectrum.dat", "w") as f_average:
-            for key, value in average.items():
-                f_average.write(f"{key:<4f}   {value:>6.10f}\n")
-        f_average.close()
-        print("Arquivo average_spectrum.dat gerado!")
+    """
+    if is_compressed(local_log):
+        with open_log(local_log) as f_log:
+            return parse_gaussian_stream(f_log)
 
-        # Calculando erro padrão
-        np.savetxt("dados_spectrum.txt", dados_spectrum, fmt="%6.10f", delimiter=";")
-        medias_spectrum = [[i, average[i]] for i in average]
-        np.savetxt("medias.txt", medias_spectrum, fmt="%6.10f", delimiter=";")
+    return parse_gaussian_log_mmap(local_log)
 
-        # Calculo do desvio padrão e erro
-        calcula_dp_erro(medias_spectrum, dados_spectrum)
-    except OSError as msg_err:
-        print(f"Erro: {msg_err}")
-    except ZeroDivisionError:
-        print(f"Divisão por zero: {A} * ({strength[j][i]} / "
-              "({fact1}/{sigma})) * math.exp(-(((1.0/{nm})-"
-              "(1.0/{eigenvalue[j][i]}))/({fact2}/{sigma}))**2)")
+
+def gaussian_state_records(data, start=0, end=None):
+    """
+    Build the records of the "Excited State" lines of a region of a Gaussian log.
+
+    Parameters
+    ----------
+    data : bytes or mmap.mmap
+        Content of the log.
+    start, end : int
+        Byte offsets of the region (for example, the l914 section).
+
+    Returns
+    -------
+    states : numpy.ndarray
+        Structured array (GAUSSIAN_STATE_DTYPE).
+
+    """
+    if end is None:
+        end = len(data)
+
+    rows = []
+    for match in RE_EXCITED_STATE_RECORD.finditer(data, start, end):
+        state, label, energy, wavelength, strength, s2 = match.groups()
+        multiplicity, _, symmetry = label.decode("ascii", "replace").partition("-")
+        rows.append((int(state), float(energy), float(wavelength), float(strength),
+                     multiplicity, symmetry, float(s2) if s2 is not None else np.nan,
+                     match.end()))
+
+    return np.array(rows, dtype=GAUSSIAN_STATE_DTYPE)
 
 
-def calcula_dp_erro(medias_spectrum, dados_spectrum):
+def parse_gaussian_states(local_log):
     """
-    Cálculo do desvio padrão e erro padrão.
+    Extract the complete records of the excited states of a Gaussian log.
+
+    Besides the wavelength and the oscillator strength (parse_gaussian), each
+    record has the number of the state, the excitation energy (eV), the
+    multiplicity and the symmetry ("Singlet" and "A" of "Singlet-A"), <S**2>
+    (NaN when absent) and the byte offset of the orbital contributions, read
+    only when requested (read_transitions). As in parse_gaussian, the last
+    l914 section is used.
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the log file and the path where it is located.
 
     Returns
     -------
-    None.
+    states : numpy.ndarray
+        Structured array (GAUSSIAN_STATE_DTYPE), one record per state.
 
     """
-    vlr_dp = []
-    for i in medias_spectrum:
-        num_onda = i[0]
-        vlr_spec = i[1]
-        qtde = 0
-        diferenca = 0
-        for j in dados_spectrum:
-            if j[0] == num_onda:
-                diferenca = diferenca + ((vlr_spec - j[1])**2)
-                qtde += 1
-        vlr_dp.append([num_onda, diferenca/qtde])
+    if is_compressed(local_log):
+        with open_log(local_log) as f_log:
+            data = f_log.read()
+        block = last_l914_block(data)
+        if block is None:
+            return np.empty(0, dtype=GAUSSIAN_STATE_DTYPE)
+        return gaussian_state_records(data, *block)
+
+    with open(local_log, "rb") as f_arquivo:
+        if os.fstat(f_arquivo.fileno()).st_size == 0:
+            return np.empty(0, dtype=GAUSSIAN_STATE_DTYPE)
+
+        with mmap.mmap(f_arquivo.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            block = last_l914_block(data)
+            if block is None:
+                return np.empty(0, dtype=GAUSSIAN_STATE_DTYPE)
+            return gaussian_state_records(data, *block)
+
+
+def read_transitions(local_log, offsets):
+    """
+    Read the orbital contributions of excited states of a Gaussian log.
+
+    All the states requested are read in a single forward pass over the
+    file, from the smallest offset to the largest. A plain file is reached
+    by seeks; a compressed file can only be decompressed forward, so the
+    bytes between two blocks of contributions are read and discarded,
+    without going back to the start of the stream.
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the log file and the path where it is located.
+    offsets : int or list
+        Byte offsets of the contributions (field "offset" of the records of
+        the states, see parse_gaussian_states).
 
+    Returns
+    -------
+    transitions : numpy.ndarray or list
+        Structured array (TRANSITION_DTYPE: occupied orbital, direction
+        "->" or "<-", virtual orbital and coefficient) of the state, or a
+        list with the array of each offset (in the order of [offsets]).
 
-def fit_lorentzian(type_of_average, wave_numbers):
     """
-    Ajuste lorentzian.
+    single = np.ndim(offsets) == 0
+    offsets = np.atleast_1d(np.asarray(offsets, dtype=np.int64)).tolist()
+    compressed = is_compressed(local_log)
+    blocks = {}
+
+    with open_log(local_log) as f_log:
+        position = 0
+        for offset in sorted(set(offsets)):
+            if not compressed:
+                f_log.seek(offset)
+            else:
+                # A block ends before the offset of the next state
+                while position < offset:
+                    skipped = len(f_log.read(min(offset - position, SKIP_BLOCK_SIZE)))
+                    if skipped == 0:
+                        break
+                    position += skipped
+
+            rows = []
+            for line in iter(f_log.readline, b""):
+                position += len(line)
+                match = RE_TRANSITION.match(line)
+                if not match:
+                    break
+                occupied, direction, virtual, coefficient = match.groups()
+                rows.append((occupied.decode(), direction.decode(), virtual.decode(),
+                             float(coefficient)))
+            blocks[offset] = np.array(rows, dtype=TRANSITION_DTYPE)
+
+    if single:
+        return blocks[offsets[0]]
+
+    return [blocks[offset] for offset in offsets]
+
+
+def parse_orca_out(local_log, representation="electric"):
+    """
+    Extract the excited states of an Orca output file.
+
+    Compressed files are decompressed on the fly (see parse_orca_stream).
 
     Parameters
     ----------
-    type_of_average : TYPE
-        DESCRIPTION.
-    wave_numbers : TYPE
-        DESCRIPTION.
+    local_log : str
+        Name of the output file and the path where it is located.
+    representation : str
+        Absorption table used (one of ORCA_REPRESENTATIONS).
 
     Returns
     -------
-    None.
+    wavelengths, strengths, founded : tuple
+        See parse_orca_stream.
 
     """
-    average = {}
+    with open_log(local_log) as f_log:
+        return parse_orca_stream(f_log, representation)
 
-    try:
-        f_spectrum_lorentzian = open("spectrum_lorentzian.dat", "w")
-
-        with open("input.dat", "r") as f_input:
-            m_valor = int(f_input.readline())
-            n_valor = [int(i) for i in f_input.readline().split(" ")]
-
-            maxn = max(n_valor)
-            eigenvalue = [[0.0]*maxn for i in range(0, m_valor)]
-            strength = [[0.0]*maxn for i in range(0, m_valor)]
-
-            for j in range(0, m_valor):
-                for i in range(0, n_valor[j]):
-                    read_line = f_input.readline()
-                    if (read_line.strip()) != "":
-                        values = [float(i) for i in read_line.split("  ")]
-                        eigenvalue[j][i] = values[0]
-                        strength[j][i] = values[1]
-        f_input.close()
-
-        for j in range(0, m_valor):
-            for nm_valor in wave_numbers:
-                spectrum = 0.0
-                for i in range(0, n_valor[j]):
-                    if type_of_average == 'aritmética':
-                        spectrum = spectrum + A * (strength[j][i] / (FACT1/SIGMA)) * \
-                                   (1 / (((nm_valor - eigenvalue[j][i])**2) + 1))
-
-                f_spectrum_lorentzian.write(f"{nm_valor:<4f}   {spectrum:>6.12f}\n")
-
-                if nm_valor in average:
-                    average[nm_valor] = average[nm_valor] + spectrum
-                else:
-                    average[nm_valor] = spectrum
 
-            f_spectrum_lorentzian.write("\n")
+def read_orca_spectra(local_log):
+    """
+    Read all the absorption tables of an Orca output file at once.
+
+    Parameters
+    ----------
+    local_log : str
+        Name of the output file and the path where it is located.
 
-        f_spectrum_lorentzian.close()
-        print("")
-        print("Arquivo spectrum_lorentzian.dat gerado!")
+    Returns
+    -------
+    sections : dict
+        See parse_orca_sections.
 
-        # Calculating and saving average
-        if type_of_average == 'aritmética':
-            for key in average.keys():
-                average[key] = average[key] / m_valor
-
-        with open("average.dat", "w") as f_average:
-            for key, value in average.items():
-                f_average.write(f"{key:<4f}   {value:>6.12f}\n")
-        f_average.close()
-        print("Arquivo average.dat gerado!")
-    except OSError as msg_err:
-        print(f'Erro ao ajustar como modelo lorentzian: {msg_err}')
-    except ValueError as msg_err:
-        print(f'Erro ao ajustar como modelo lorentzian: {msg_err}')
+    """
+    with open_log(local_log) as f_log:
+        return parse_orca_sections(f_log)
 
 
-def main(type_of_fit, type_of_average, wave_numbers, wave_numbers_interval):
+def parse_orca_sections(f_log):
     """
-    Função principal.
+    Read the absorption tables of an Orca output in a single pass.
+
+    A small state machine, driven by compiled regular expressions, follows
+    the stream: the title of a table starts a section, its rows are
+    collected and the first blank line after them ends it. The tables via
+    electric and velocity dipole moments, and the SOC corrected ones when
+    present, are captured in the same pass. If a table appears more than
+    once (several calculations in one output), the last one is kept.
 
     Parameters
     ----------
-    type_of_fit : TYPE
-        tipo de ajuste.
-    type_of_average : TYPE
-        tipo de media a ser calculada.
-    wave_numbers : TYPE
-        faixa de números de onda.
-    wave_numbers_interval : TYPE
-        intervalo para a faixa de número de onda.
+    f_log : file object
+        Binary stream with the content of the output.
 
     Returns
     -------
-    None.
+    sections : dict
+        Structured array (ORCA_STATE_DTYPE: state, energy in cm-1,
+        wavelength in nm and oscillator strength) for each table found,
+        by representation ("electric", "velocity", "soc_electric",
+        "soc_velocity").
 
     """
-    type_of_fit, type_of_average, wave_numbers, wave_numbers_interval = questions(type_of_fit,
-                                                                                  type_of_average, wave_numbers,
-                                                                                  wave_numbers_interval)
+    sections = {}
+    section = None
+    rows = []
+
+    for line in f_log:
+        if section is None:
+            if b"ABSORPTION SPECTRUM" in line:
+                match = RE_ORCA_SECTION.match(line)
+                if match:
+                    section = ("soc_" if match.group(1) else "") + match.group(2).decode().lower()
+                    rows = []
+            continue
+
+        match = RE_ORCA_ROW.match(line) or RE_ORCA6_ROW.match(line)
+        if match:
+            rows.append(match.groups())
+        elif rows and not line.strip():
+            sections[section] = np.array(rows, dtype=bytes).astype(np.float64)
+            section = None
+        elif RE_ORCA_SECTION.match(line):
+            section = None
+
+    if section is not None and rows:
+        sections[section] = np.array(rows, dtype=bytes).astype(np.float64)
+
+    for name, values in sections.items():
+        table = np.empty(len(values), dtype=ORCA_STATE_DTYPE)
+        for k, field in enumerate(ORCA_STATE_DTYPE.names):
+            table[field] = values[:, k]
+        sections[name] = table
+
+    return sections
+
+
+def parse_orca_stream(f_log, representation="electric"):
+    """
+    Extract the excited states of an Orca output read as a stream of bytes.
 
-    if type_of_fit == "gaussian":
-        fit_gaussian(type_of_average, wave_numbers)
-    elif type_of_fit == "lorentzian":
-        fit_lorentzian(type_of_average, wave_numbers)
+    Parameters
+    ----------
+    f_log : file object
+        Binary stream with the content of the output.
+    representation : str
+        Absorption table used (one of ORCA_REPRESENTATIONS). The default
+        is the section [ABSORPTION SPECTRUM VIA TRANSITION ELECTRIC DIPOLE
+        MOMENTS].
+
+    Returns
+    -------
+    wavelengths : numpy.ndarray
+        Wavelengths (nm) of the excited states.
+    strengths : numpy.ndarray
+        Oscillator strengths of the excited states.
+    founded : bool
+        Always True; Orca outputs are not verified.
+
+    """
+    return orca_result(parse_orca_sections(f_log), representation)
+
+
+def orca_result(sections, representation="electric"):
+    """
+    Take the excited states of one absorption table of an Orca output.
+
+    Parameters
+    ----------
+    sections : dict
+        Absorption tables of the output (see parse_orca_sections).
+    representation : str
+        Absorption table used (one of ORCA_REPRESENTATIONS).
+
+    Returns
+    -------
+    wavelengths, strengths, founded : tuple
+        See parse_orca_stream (empty arrays if the table is not in the output).
+
+    """
+    table = sections.get(representation, np.empty(0, dtype=ORCA_STATE_DTYPE))
+
+    return table["wavelength"].copy(), table["strength"].copy(), True
+
+
+def parser_name(parser):
+    """
+    Name that identifies a parser (and its options) in the cache.
+
+    Parameters
+    ----------
+    parser : function
+        Function, or functools.partial of a function, that reads one file.
+
+    Returns
+    -------
+    name : str
+        Name of the function followed by the fixed arguments, if any.
+
+    """
+    if isinstance(parser, partial):
+        arguments = [str(i) for i in parser.args] + [f"{k}={v}" for k, v in parser.keywords.items()]
+        return ":".join([parser_name(parser.func)] + arguments)
+
+    return parser.__name__
+
+
+class ParseCache:
+    """
+    Persistent cache of the excited states extracted from each file.
+
+    The records are kept in a SQLite database next to the data and are
+    identified by the path, size and modification time of the file (and,
+    optionally, by a hash of its content) and by the parser and its version
+    (PARSER_VERSION), so only new or changed files are read again.
+    """
+
+    def __init__(self, local, use_hash=False):
+        """
+        Open (or create) the cache of a directory.
+
+        Parameters
+        ----------
+        local : str
+            Directory where the database is kept.
+        use_hash : bool
+            Also compare a SHA-1 of the content of the files.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.use_hash = use_hash
+        self.keys = {}
+        self.connection = sqlite3.connect(str(Path(local) / CACHE_FILE))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS parsed ("
+                                "path TEXT, parser TEXT, size INTEGER, mtime_ns INTEGER, "
+                                "digest TEXT, wavelengths BLOB, strengths BLOB, founded INTEGER, "
+                                "PRIMARY KEY (path, parser))")
+
+    def key(self, local_log):
+        """
+        Return the values that identify the current version of a file.
+
+        Parameters
+        ----------
+        local_log : str
+            Name of the file and the path where it is located.
+
+        Returns
+        -------
+        path, size, mtime_ns, digest : tuple
+            Absolute path, size, modification time and SHA-1 (or "").
+
+        """
+        path = os.path.abspath(local_log)
+        stat = os.stat(path)
+        digest = ""
+        if self.use_hash:
+            sha1 = hashlib.sha1()
+            with open(path, "rb") as f_file:
+                for block in iter(partial(f_file.read, HASH_BLOCK_SIZE), b""):
+                    sha1.update(block)
+            digest = sha1.hexdigest()
+
+        return path, stat.st_size, stat.st_mtime_ns, digest
+
+    def parser_key(self, parser):
+        """
+        Return the name of a parser in the records, with the version of the parsers.
+
+        Parameters
+        ----------
+        parser : function
+            Function that reads the file.
+
+        Returns
+        -------
+        name : str
+            parser_name followed by PARSER_VERSION.
+
+        """
+        return f"{parser_name(parser)}@{PARSER_VERSION}"
+
+    def get(self, local_log, parser):
+        """
+        Return the cached result of a file, or None if it is unknown or has changed.
+
+        Parameters
+        ----------
+        local_log : str
+            Name of the file and the path where it is located.
+        parser : function
+            Function that reads the file.
+
+        Returns
+        -------
+        result : tuple
+            (wavelengths, strengths, founded) or None.
+
+        """
+        path, size, mtime_ns, digest = self.keys[local_log] = self.key(local_log)
+        if self.connection is None:
+            return None
+
+        row = self.connection.execute("SELECT size, mtime_ns, digest, wavelengths, strengths, founded "
+                                      "FROM parsed WHERE path = ? AND parser = ?",
+                                      (path, self.parser_key(parser))).fetchone()
+        if row is None or tuple(row[:2]) != (size, mtime_ns) or (self.use_hash and row[2] != digest):
+            return None
+
+        return (np.frombuffer(row[3], dtype=np.float64), np.frombuffer(row[4], dtype=np.float64),
+                bool(row[5]))
+
+    def put(self, local_log, parser, result):
+        """
+        Save the result of a file.
+
+        The file is identified by the values read in get(), before it was
+        parsed, so a file changed during the reading is parsed again later.
+
+        Parameters
+        ----------
+        local_log : str
+            Name of the file and the path where it is located.
+        parser : function
+            Function that read the file.
+        result : tuple
+            (wavelengths, strengths, founded) returned by [parser].
+
+        Returns
+        -------
+        None.
+
+        """
+        self.put_all(local_log, {parser: result})
+
+    def put_all(self, local_log, results):
+        """
+        Save the results of several parsers of a file (read only once).
+
+        Parameters
+        ----------
+        local_log : str
+            Name of the file and the path where it is located.
+        results : dict
+            (wavelengths, strengths, founded) of each parser.
+
+        Returns
+        -------
+        None.
+
+        """
+        path, size, mtime_ns, digest = self.keys.pop(local_log, None) or self.key(local_log)
+        if self.connection is None:
+            return
+
+        try:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(path, self.parser_key(parser), size, mtime_ns, digest,
+                  np.ascontiguousarray(wavelengths, dtype=np.float64).tobytes(),
+                  np.ascontiguousarray(strengths, dtype=np.float64).tobytes(), int(founded))
+                 for parser, (wavelengths, strengths, founded) in results.items()])
+        except sqlite3.Error as msg_err:
+            # Database that can be read but not written: the results are not saved
+            print(f" + Cache {CACHE_FILE} não atualizado: {msg_err}")
+            self.connection.close()
+            self.connection = None
+
+    def close(self):
+        """
+        Save the changes and close the database.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.connection is None:
+            return
+
+        try:
+            self.connection.commit()
+        except sqlite3.Error as msg_err:
+            print(f" + Cache {CACHE_FILE} não atualizado: {msg_err}")
+        finally:
+            self.connection.close()
+            self.connection = None
+
+
+def open_cache(local, use_hash=False):
+    """
+    Open the cache of a directory (ParseCache), or continue without it.
+
+    A database that cannot be opened or created (a read-only directory, a
+    damaged file) only makes the files be read again.
+
+    Parameters
+    ----------
+    local : str
+        Directory where the database is kept.
+    use_hash : bool
+        Also compare a SHA-1 of the content of the files.
+
+    Returns
+    -------
+    cache : ParseCache
+        Cache of the directory, or None if it cannot be used.
+
+    """
+    try:
+        return ParseCache(local, use_hash)
+    except sqlite3.Error as msg_err:
+        print(f" + Cache {CACHE_FILE} indisponível ({msg_err}), seguindo sem cache")
+        return None
+
+
+def extract_excited_states(list_log, parser=parse_gaussian, workers=None, cache=None):
+    """
+    Extract the excited states of several files, in parallel processes.
+
+    The files are sent to the processes from the largest to the smallest,
+    so that no process is left alone with a big file at the end, but the
+    results keep the order of [list_log]. With a [cache], only the files
+    that are not in it (or have changed) are read.
+
+    Parameters
+    ----------
+    list_log : list
+        Files (with path) to be read.
+    parser : function
+        Function that reads one file (parse_gaussian, parse_orca_out or
+        read_orca_spectra).
+    workers : int
+        Number of processes. None uses all the CPUs available (available_cpus);
+        1 reads the files in this process.
+    cache : ParseCache
+        Cache of the files already read (None, no cache).
+
+    Returns
+    -------
+    results : list
+        Result of [parser] (wavelengths, strengths, founded) for each file,
+        in the order of [list_log].
+
+    """
+    if workers is None:
+        workers = available_cpus()
+
+    results = [None] * len(list_log)
+    if cache is not None:
+        results = [cache.get(log, parser) for log in list_log]
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    if workers <= 1 or len(missing) <= 1:
+        for i in missing:
+            results[i] = parser(list_log[i])
+    else:
+        # Largest files first (load balance between the processes)
+        order = sorted(missing, key=lambda i: os.path.getsize(list_log[i]), reverse=True)
+        chunksize = max(1, len(order) // (workers * 16))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i, result in zip(order, executor.map(parser, [list_log[i] for i in order],
+                                                     chunksize=chunksize)):
+                results[i] = result
+
+    if cache is not None:
+        for i in missing:
+            cache.put(list_log[i], parser, results[i])
+
+    return results
+
+
+def extract_orca_states(list_log, representation="electric", workers=None, cache=None):
+    """
+    Extract the excited states of several Orca outputs, with all the tables cached.
+
+    Each output not in the cache is read once (read_orca_spectra) and all
+    its absorption tables are saved in the cache, one record for each
+    representation (parse_orca_out with that representation), so changing
+    the representation does not read the outputs again. The table used is
+    chosen after the cache is consulted.
+
+    Parameters
+    ----------
+    list_log : list
+        Files (with path) to be read.
+    representation : str
+        Absorption table used (one of ORCA_REPRESENTATIONS).
+    workers : int
+        Number of processes (see extract_excited_states).
+    cache : ParseCache
+        Cache of the files already read (None, no cache).
+
+    Returns
+    -------
+    results : list
+        (wavelengths, strengths, founded) of each file, in the order of [list_log].
+
+    """
+    parsers = {name: partial(parse_orca_out, representation=name) for name in ORCA_REPRESENTATIONS}
+
+    results = [None] * len(list_log)
+    if cache is not None:
+        results = [cache.get(log, parsers[representation]) for log in list_log]
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    all_sections = extract_excited_states([list_log[i] for i in missing], read_orca_spectra, workers)
+    for i, sections in zip(missing, all_sections):
+        results[i] = orca_result(sections, representation)
+        if cache is not None:
+            cache.put_all(list_log[i], {parser: orca_result(sections, name)
+                                        for name, parser in parsers.items()})
+
+    return results
+
+
+def iter_excited_states(list_log, parser=parse_gaussian, workers=None, cache=None):
+    """
+    Extract the excited states of several files, one file at a time (generator).
+
+    Same as extract_excited_states, but each result is given as soon as it
+    is ready (in the order of [list_log]) and only a few files (about four
+    per process) are being read or waiting at a time, so the memory does
+    not grow with the number of files.
+
+    Parameters
+    ----------
+    list_log : list
+        Files (with path) to be read.
+    parser : function
+        Function that reads one file (parse_gaussian or parse_orca_out).
+    workers : int
+        Number of processes. None uses all the CPUs available (available_cpus);
+        1 reads the files in this process.
+    cache : ParseCache
+        Cache of the files already read (None, no cache).
+
+    Yields
+    ------
+    local_log, result : tuple
+        File and its (wavelengths, strengths, founded).
+
+    """
+    if workers is None:
+        workers = available_cpus()
+
+    def cached(local_log):
+        return cache.get(local_log, parser) if cache is not None else None
+
+    if workers <= 1:
+        for local_log in list_log:
+            result = cached(local_log)
+            if result is None:
+                result = parser(local_log)
+                if cache is not None:
+                    cache.put(local_log, parser, result)
+            yield local_log, result
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        files = iter(list_log)
+        for local_log in files:
+            result = cached(local_log)
+            pending.append((local_log, result,
+                            executor.submit(parser, local_log) if result is None else None))
+
+            # Results are given in order; the queue is limited to 4 files per process
+            while pending and (len(pending) >= workers * 4 or pending[0][2] is None):
+                yield wait_result(pending.popleft(), parser, cache)
+
+        while pending:
+            yield wait_result(pending.popleft(), parser, cache)
+
+
+def wait_result(item, parser, cache):
+    """
+    Wait for the result of a file submitted by iter_excited_states.
+
+    Parameters
+    ----------
+    item : tuple
+        File, result found in the cache (or None) and future of the parser.
+    parser : function
+        Function that reads the file.
+    cache : ParseCache
+        Cache where a new result is kept (None, no cache).
+
+    Returns
+    -------
+    local_log, result : tuple
+        File and its (wavelengths, strengths, founded).
+
+    """
+    local_log, result, future = item
+    if future is not None:
+        result = future.result()
+        if cache is not None:
+            cache.put(local_log, parser, result)
+
+    return local_log, result
+
+
+def save_input(list_log, list_num_excited_state, list_wavelengths, list_strengths,
+               text_input=False):
+    """
+    Save the excited states extracted from the files (input.npz and, optionally, input.dat).
+
+    Parameters
+    ----------
+    list_log : list
+        Name of each file.
+    list_num_excited_state : list
+        Number of excited states of each file.
+    list_wavelengths : list
+        Array of wavelengths (nm) of each file.
+    list_strengths : list
+        Array of oscillator strengths of each file.
+    text_input : bool
+        Also write the text file input.dat.
+
+    Returns
+    -------
+    None.
+
+    """
+    counts = np.array(list_num_excited_state, dtype=np.int64)
+    wavelengths = np.concatenate([np.empty(0)] + list_wavelengths)
+    strengths = np.concatenate([np.empty(0)] + list_strengths)
+
+    save_input_npz(INPUT_NPZ, list_log, counts, wavelengths, strengths)
+    if text_input:
+        export_input_dat(INPUT_DAT, list_log, counts, wavelengths, strengths)
+        stamp_input_dat()
+
+
+def extract_data_orca(workers=None, use_cache=True, use_hash=False, text_input=False,
+                      representation="electric", discovery=None):
+    """
+    Extract data about excited states in Orca files and create a file name "input.npz".
+
+    Parameters
+    ----------
+    workers : int
+        Number of processes used in the extraction (None, all the CPUs).
+    use_cache : bool
+        Keep the extracted data in a cache (ParseCache) in the directory of the files.
+    use_hash : bool
+        Also compare the content of the files with the cache (SHA-1).
+    text_input : bool
+        Also write the text file input.dat (besides input.npz).
+    representation : str
+        Absorption table used (one of ORCA_REPRESENTATIONS).
+    discovery : dict
+        Options of the search of the files (recursive, include, exclude and
+        walkers of get_files).
+
+    Returns
+    -------
+    None.
+
+    """
+    list_wavelengths = []
+    list_strengths = []
+    list_num_excited_state = []
+
+    try:
+        local_files = input("Local of files".ljust(57, ".") + ": ").strip()
+        if local_files.strip() != "":
+            if is_archive(local_files):
+                # Members of a tar or zip file, read as a stream (only once)
+                list_log, results = read_archive(local_files, '.out',
+                                                 partial(parse_orca_stream,
+                                                         representation=representation))
+            else:
+                if local_files[-1] != get_separator():
+                    local_files = local_files + get_separator()
+
+                if not file_exist(local_files):
+                    return
+
+                list_log = get_files(local_files, '.out', **(discovery or {}))
+
+                cache = open_cache(local_files, use_hash) if use_cache else None
+                results = extract_orca_states([local_files + log for log in list_log],
+                                              representation, workers, cache)
+                if cache is not None:
+                    cache.close()
+
+            for log, (wavelengths, strengths, _) in zip(list_log, results):
+                print(f" - Extract excited states from the file: {log}")
+                list_wavelengths.append(wavelengths)
+                list_strengths.append(strengths)
+                list_num_excited_state.append(len(wavelengths))
+
+            # Saving data
+            save_input(list_log, list_num_excited_state, list_wavelengths, list_strengths,
+                       text_input)
+            print("")
+    except OSError as msg_err:
+        print(f" + Erro: {msg_err}")
+
+
+def extract_data_gaussian(workers=None, use_cache=True, use_hash=False, text_input=False,
+                          discovery=None):
+    """
+    Extraindo dados de estados excitados no arquivo de saída do Gaussian.
+
+    Parameters
+    ----------
+    workers : int
+        Número de processos usados na extração (None, todas as CPUs).
+    use_cache : bool
+        Guarda os dados extraídos em um cache (ParseCache) no diretório dos arquivos.
+    use_hash : bool
+        Compara também o conteúdo dos arquivos com o cache (SHA-1).
+    text_input : bool
+        Grava também o arquivo texto input.dat (além do input.npz).
+    discovery : dict
+        Opções da busca dos arquivos (recursive, include, exclude e walkers
+        de get_files).
+
+    Returns
+    -------
+    None.
+
+    """
+    list_wavelengths = []
+    list_strengths = []
+    list_num_excited_state = []
+
+    try:
+        local_files = input("Local dos arquivos".ljust(57, ".") + ": ").strip()
+        if local_files.strip() != "":
+            if is_archive(local_files):
+                # Membros de um arquivo tar ou zip, lidos em sequência (uma única vez)
+                total_bytes = os.path.getsize(local_files)
+                print(" - Extraindo dados...")
+                start = time.perf_counter()
+                all_logs, results = read_archive(local_files, '.log', parse_gaussian_stream)
+                elapsed = time.perf_counter() - start
+            else:
+                if local_files[-1] != get_separator():
+                    local_files = local_files + get_separator()
+
+                if not file_exist(local_files):
+                    print(" + Caminho não existe. Saindo!")
+                    sys.exit()
+
+                all_logs = get_files(local_files, '.log', **(discovery or {}))
+                total_bytes = sum(os.path.getsize(local_files + log) for log in all_logs)
+
+                # Extraindo dados (uma única leitura por arquivo)
+                print(" - Extraindo dados...")
+                start = time.perf_counter()
+                cache = open_cache(local_files, use_hash) if use_cache else None
+                results = extract_excited_states([local_files + log for log in all_logs],
+                                                 parse_gaussian, workers, cache)
+                if cache is not None:
+                    cache.close()
+                elapsed = time.perf_counter() - start
+
+            list_log = []
+            for log, (wavelengths, strengths, terminated) in zip(all_logs, results):
+                if not terminated:
+                    print(f" + Arquivo sem [Normal termination], ignorado: {log}")
+                    continue
+
+                print(f" - Extraindo estado excitado do arquivo: {log}")
+                list_log.append(log)
+                list_wavelengths.append(wavelengths)
+                list_strengths.append(strengths)
+                list_num_excited_state.append(len(wavelengths))
+
+            if elapsed > 0:
+                print(f" - {total_bytes / 1.0E6:.2f} MB lidos "
+                      f"({total_bytes / 1.0E6 / elapsed:.2f} MB/s)")
+
+            # Saving data
+            save_input(list_log, list_num_excited_state, list_wavelengths, list_strengths,
+                       text_input)
+            print("")
+        else:
+            print(" + Caminho não informado. Saindo!")
+            sys.exit()
+    except OSError as msg_err:
+        print(f" + Erro: {msg_err}")
+
+
+def save_input_npz(file_name, names, counts, wavelengths, strengths):
+    """
+    Save the excited states of an ensemble in the binary format (.npz).
+
+    The states of all the structures are kept in two flat arrays; the states
+    of the structure j are the positions offsets[j] to offsets[j+1]. Writing
+    and loading are a few operations over whole arrays.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the .npz file.
+    names : list
+        Name of each structure (output file).
+    counts : array
+        Number of excited states of each structure.
+    wavelengths : array
+        Wavelengths (nm) of all the states, structure after structure.
+    strengths : array
+        Oscillator strengths of all the states.
+
+    Returns
+    -------
+    None.
+
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    with open(file_name, "wb") as f_input:
+        np.savez(f_input, names=np.array(names, dtype=str), offsets=offsets,
+                 wavelengths=np.asarray(wavelengths, dtype=np.float64),
+                 strengths=np.asarray(strengths, dtype=np.float64))
+
+
+def load_input_npz(file_name=INPUT_NPZ):
+    """
+    Load the excited states of an ensemble saved by save_input_npz.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the .npz file.
+
+    Returns
+    -------
+    names : list
+        Name of each structure.
+    counts : numpy.ndarray
+        Number of excited states of each structure.
+    wavelengths : numpy.ndarray
+        Wavelengths (nm) of all the states, structure after structure.
+    strengths : numpy.ndarray
+        Oscillator strengths of all the states.
+
+    """
+    with np.load(file_name) as data:
+        return (data["names"].tolist(), np.diff(data["offsets"]),
+                data["wavelengths"], data["strengths"])
+
+
+def export_input_dat(file_name, names, counts, wavelengths, strengths, with_names=False):
+    """
+    Write the excited states of an ensemble in the text format (input.dat).
+
+    The file has the number of structures, a line with the number of states
+    of each structure, optionally a line with the names of the files (as
+    the window version writes) and one line "wavelength  strength" per state.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the text file.
+    names : list
+        Name of each structure.
+    counts : array
+        Number of excited states of each structure.
+    wavelengths : array
+        Wavelengths (nm) of all the states.
+    strengths : array
+        Oscillator strengths of all the states.
+    with_names : bool
+        Write the line with the names of the files.
+
+    Returns
+    -------
+    None.
+
+    """
+    with open(file_name, "w") as f_input:
+        f_input.write(f"{len(counts):<4d}\n")
+        f_input.write(f'{" ".join(str(i) for i in counts)}\n')
+        if with_names:
+            f_input.write(f'{" ".join(names)}\n')
+        f_input.write("".join(f"{i}  {j}\n" for i, j in zip(np.asarray(wavelengths).tolist(),
+                                                            np.asarray(strengths).tolist())))
+
+
+def load_input_dat(file_name=INPUT_DAT):
+    """
+    Load the excited states of an ensemble from the text format (input.dat).
+
+    The block of states is read with a single NumPy call (numpy.loadtxt), so
+    any whitespace between the columns and at the end of the lines is
+    accepted. The line with the names of the files, written by the window
+    version, is optional.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the text file.
+
+    Returns
+    -------
+    names, counts, wavelengths, strengths : tuple
+        See load_input_npz. Without the line of names, the structures are
+        called by their position.
+
+    """
+    with open(file_name, "r") as f_input:
+        # m_valor representa a quantidade de estruturas que terão os espectros UV-VIS calculados
+        m_valor = int(f_input.readline())
+        # n_valor representa a quantidade de estados excitados para cada estrutura
+        n_valor = np.array(f_input.readline().split(), dtype=np.int64)[:m_valor]
+        names = [str(j + 1) for j in range(0, m_valor)]
+
+        # Optional line with the names of the files (window version)
+        position = f_input.tell()
+        read_line = f_input.readline()
+        try:
+            [float(i) for i in read_line.split()]
+            f_input.seek(position)
+        except ValueError:
+            names = read_line.split()
+
+        total = int(n_valor.sum())
+        values = np.empty((0, 2))
+        if total > 0:
+            values = np.loadtxt(f_input, dtype=np.float64, usecols=(0, 1), ndmin=2)[:total]
+
+    if len(n_valor) != m_valor or len(values) != total:
+        raise ValueError(f"{file_name}: {m_valor} structures and {total} excited states expected, "
+                         f"{len(n_valor)} structures and {len(values)} states found")
+
+    return names, n_valor, values[:, 0], values[:, 1]
+
+
+def load_input():
+    """
+    Load the excited states saved by the extraction (input.npz or input.dat).
+
+    The newer of the two files is used. input.dat written from the same data
+    (--text-input, --export-dat) has the time of input.npz (stamp_input_dat)
+    and input.npz is preferred, since it is faster to load; an input.dat
+    edited after the extraction is used, with a warning. Directories without
+    input.npz (older extractions) are read from input.dat.
+
+    Returns
+    -------
+    names, counts, wavelengths, strengths : tuple
+        See load_input_npz.
+
+    """
+    if file_exist(INPUT_NPZ):
+        if file_exist(INPUT_DAT) and os.stat(INPUT_DAT).st_mtime_ns > os.stat(INPUT_NPZ).st_mtime_ns:
+            print(f" + {INPUT_DAT} é mais recente que {INPUT_NPZ} (editado?), usando {INPUT_DAT}")
+            return load_input_dat(INPUT_DAT)
+        return load_input_npz(INPUT_NPZ)
+
+    return load_input_dat(INPUT_DAT)
+
+
+def stamp_input_dat():
+    """
+    Give to input.dat the modification time of input.npz, written from the same data.
+
+    load_input takes the newer of the two files, so an input.dat written by
+    the extraction (or by --export-dat) does not replace input.npz, while
+    an input.dat edited by hand later does.
+
+    Returns
+    -------
+    None.
+
+    """
+    stat = os.stat(INPUT_NPZ)
+    os.utime(INPUT_DAT, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+class InputWriter:
+    """
+    Write the excited states of an ensemble file after file (input.npz and input.dat).
+
+    The states are appended to a temporary binary file in the working
+    directory, so only the names and the number of states of each structure
+    stay in memory. When the writer is closed, input.npz is written from a
+    memory map of the temporary file, and input.dat (text_input) in blocks,
+    since its header (the number of states of each structure) is only known
+    at the end.
+
+    Parameters
+    ----------
+    text_input : bool
+        Also write the text file input.dat.
+
+    """
+
+    BLOCK_SIZE = 65536
+
+    def __init__(self, text_input=False):
+        self.text_input = text_input
+        self.names = []
+        self.counts = []
+        self.f_states = tempfile.TemporaryFile(dir=".", prefix=".tmp_states_")
+
+    def add(self, name, wavelengths, strengths):
+        """Append the excited states of one structure."""
+        self.names.append(name)
+        self.counts.append(len(wavelengths))
+        np.column_stack((np.asarray(wavelengths, dtype=np.float64),
+                         np.asarray(strengths, dtype=np.float64))).tofile(self.f_states)
+
+    def close(self):
+        """Write input.npz (and input.dat) and remove the temporary file."""
+        try:
+            self.f_states.flush()
+            counts = np.array(self.counts, dtype=np.int64)
+            states = np.empty((0, 2))
+            if counts.sum() > 0:
+                states = np.memmap(self.f_states, dtype=np.float64, mode="r",
+                                   shape=(int(counts.sum()), 2))
+
+            save_input_npz(INPUT_NPZ, self.names, counts, states[:, 0], states[:, 1])
+            if self.text_input:
+                with open(INPUT_DAT, "w") as f_input:
+                    f_input.write(f"{len(counts):<4d}\n")
+                    f_input.write(f'{" ".join(str(i) for i in counts)}\n')
+                    for k in range(0, len(states), self.BLOCK_SIZE):
+                        f_input.write("".join(f"{i}  {j}\n" for i, j in
+                                              states[k:k + self.BLOCK_SIZE].tolist()))
+                stamp_input_dat()
+            del states
+        finally:
+            self.f_states.close()
+
+
+def structure_offsets(counts):
+    """
+    Positions of the states of each structure in the flat arrays of an ensemble.
+
+    Parameters
+    ----------
+    counts : array
+        Number of excited states of each structure.
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        The states of the structure j are the positions offsets[j] to offsets[j+1].
+
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return offsets
+
+
+def available_cpus():
+    """
+    Number of CPUs this process may run on.
+
+    os.sched_getaffinity respects the CPUs given to the job (taskset, the
+    scheduler of a cluster); where it does not exist, os.cpu_count is used.
+
+    Returns
+    -------
+    cpus : int
+        Number of CPUs.
+
+    """
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def broadening_tiles(counts, n_grid, max_bytes=MAX_BROADEN_BYTES, dtype=np.float64):
+    """
+    Split the terms (states x wavenumbers) of an ensemble in tiles within a memory budget.
+
+    Each tile is a block of whole structures by a block of wavenumbers,
+    whose terms (of [dtype]) fit in [max_bytes]. The wavenumbers are split
+    only if the largest structure alone does not fit.
+
+    Parameters
+    ----------
+    counts : array
+        Number of excited states of each structure.
+    n_grid : int
+        Number of wavenumbers.
+    max_bytes : int
+        Memory (bytes) of the terms of one tile.
+    dtype : numpy.dtype
+        Type of the terms.
+
+    Returns
+    -------
+    structures : list
+        Pairs (first, last + 1) of the structures of each block.
+    grid : list
+        Pairs (first, last + 1) of the wavenumbers of each block.
+
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    max_terms = max(1, int(max_bytes) // np.dtype(dtype).itemsize)
+    largest = max(1, int(counts.max(initial=0)))
+
+    grid_size = max(1, min(n_grid, max_terms // largest))
+    grid = [(g, min(g + grid_size, n_grid)) for g in range(0, n_grid, grid_size)]
+
+    max_states = max(largest, max_terms // grid_size)
+    offsets = structure_offsets(counts)
+    structures = []
+    first = 0
+    while first < len(counts):
+        # Last structure whose states still fit in the tile (at least one structure)
+        last = int(np.searchsorted(offsets, offsets[first] + max_states, side="right")) - 1
+        last = max(last, first + 1)
+        structures.append((first, last))
+        first = last
+
+    return structures, grid
+
+
+def truncation_error_bound(cutoff):
+    """
+    Largest relative error of a gaussian truncated at [cutoff] widths.
+
+    A term left out of the window is at least [cutoff] widths (FACT2/SIGMA,
+    in 1/nm) from its transition, so it is at most exp(-cutoff**2) times the
+    height of the peak of that transition.
+
+    Parameters
+    ----------
+    cutoff : float
+        Half width of the window, in widths of the gaussian.
+
+    Returns
+    -------
+    error : float
+        exp(-cutoff**2).
+
+    """
+    return math.exp(-cutoff**2)
+
+
+def broaden_gaussian_window(counts, wavelengths, strengths, wave_numbers, cutoff,
+                            max_bytes=MAX_BROADEN_BYTES, block_size=WINDOW_BLOCK_SIZE,
+                            width=GAUSSIAN_WIDTH):
+    """
+    Gaussian spectra of an ensemble, with each transition evaluated only near its peak.
+
+    The window of each transition, the wavenumbers within [cutoff] widths
+    (FACT2/SIGMA) of it in the 1/nm space of the formula, is found with
+    numpy.searchsorted over the sorted grid. The grid is split in blocks of
+    [block_size] points and, in each block, only the transitions whose
+    window reaches it are evaluated (with the same tiles of broaden_gaussian),
+    so the cost is about states x (window + block), not states x grid. The
+    terms left out are at most truncation_error_bound(cutoff) of the peak of
+    their transition.
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    cutoff : float
+        Half width of the window, in widths of the gaussian.
+    max_bytes : int
+        Memory (bytes) of the temporary arrays.
+    block_size : int
+        Number of wavenumbers of each block of the grid.
+    width : float
+        Width (1/e half width) of the gaussian (eV).
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+
+    """
+    wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64)
+    if np.any(wave_numbers == 0) or np.any(wavelengths == 0):
+        raise ZeroDivisionError("comprimento de onda igual a zero")
+
+    width, coefficient = gaussian_parameters(strengths, width)
+    counts = np.asarray(counts, dtype=np.int64)
+    grid = 1.0 / wave_numbers
+    order = np.argsort(grid, kind="stable")
+    sorted_grid = grid[order]
+
+    offsets = structure_offsets(counts)
+    structure = np.repeat(np.arange(len(counts)), counts)
+    inverse = 1.0 / wavelengths
+
+    # Window [first, last) of each transition over the sorted grid
+    first = np.searchsorted(sorted_grid, inverse - cutoff * width, side="left")
+    last = np.searchsorted(sorted_grid, inverse + cutoff * width, side="right")
+
+    block_size = max(1, min(int(block_size), len(grid)))
+    structures, _ = broadening_tiles(counts, block_size, max_bytes)
+
+    spectra = np.zeros((len(counts), len(grid)))
+    for g_first in range(0, len(grid), block_size):
+        g_last = min(g_first + block_size, len(grid))
+        columns = order[g_first:g_last]
+
+        for s_first, s_last in structures:
+            start, end = offsets[s_first], offsets[s_last]
+            states = np.flatnonzero((first[start:end] < g_last) & (last[start:end] > g_first))
+            if len(states) == 0:
+                continue
+            states += start
+
+            # States are still grouped by structure: one column of the result per structure
+            rows = np.flatnonzero(np.diff(structure[states], prepend=-1))
+            terms = np.subtract(sorted_grid[g_first:g_last, np.newaxis], inverse[states])
+            terms /= width
+            np.square(terms, out=terms)
+            np.negative(terms, out=terms)
+            np.exp(terms, out=terms)
+            terms *= coefficient[states]
+            spectra[np.ix_(structure[states[rows]], columns)] = np.add.reduceat(terms, rows,
+                                                                                axis=1).T
+            del terms
+
+    return spectra
+
+
+def gaussian_line(distance, width):
+    """
+    Gaussian line shape, exp(-(distance/width)**2), computed in place.
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition (overwritten with the result).
+    width : float
+        Width (same unit of [distance]).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Values of the line shape (height 1 at the transition).
+
+    """
+    distance /= width
+    np.square(distance, out=distance)
+    np.negative(distance, out=distance)
+    np.exp(distance, out=distance)
+
+    return distance
+
+
+def lorentzian_line(distance, width):
+    """
+    Lorentzian line shape, width**2 / (distance**2 + width**2), computed in place.
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition (overwritten with the result).
+    width : float
+        Half width at half maximum (same unit of [distance]).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Values of the line shape (height 1 at the transition).
+
+    """
+    np.square(distance, out=distance)
+    distance += width**2
+    np.divide(width**2, distance, out=distance)
+
+    return distance
+
+
+def gaussian_terms_numpy(grid, positions, weights, width):
+    """
+    Gaussian terms of a tile, weights * exp(-((grid - positions)/width)**2), with NumPy.
+
+    Reference of the backends of GAUSSIAN_BACKENDS, evaluated in place
+    (gaussian_line).
+
+    Parameters
+    ----------
+    grid : numpy.ndarray
+        Positions of the grid (1/nm).
+    positions : numpy.ndarray
+        Position of each transition (1/nm).
+    weights : numpy.ndarray
+        Height of the line of each transition.
+    width : float
+        Width of the gaussian (1/nm).
+
+    Returns
+    -------
+    terms : numpy.ndarray
+        Terms of each transition at each position of the grid (transitions x grid).
+
+    """
+    terms = gaussian_line(np.subtract(grid, positions[:, np.newaxis]), width)
+    terms *= weights[:, np.newaxis]
+
+    return terms
+
+
+def gaussian_terms_numexpr(grid, positions, weights, width):
+    """
+    Gaussian terms of a tile (gaussian_terms_numpy) in a single numexpr expression.
+
+    numexpr evaluates the whole expression in blocks that stay in the CPU
+    cache, without temporary arrays, using all the threads of numexpr. The
+    width has the type of the grid, so float32 terms stay in float32.
+
+    Parameters
+    ----------
+    grid, positions, weights, width :
+        See gaussian_terms_numpy.
+
+    Returns
+    -------
+    terms : numpy.ndarray
+        Terms of each transition at each position of the grid (transitions x grid).
+
+    """
+    return numexpr.evaluate("w * exp(-((g - p) / s)**2)",
+                            local_dict={"g": grid[np.newaxis, :], "p": positions[:, np.newaxis],
+                                        "w": weights[:, np.newaxis], "s": grid.dtype.type(width)})
+
+
+if numba is not None:
+    @numba.njit(nogil=True, cache=True)
+    def gaussian_row_numba(grid, position, weight, width, row):
+        """Gaussian terms of one transition at each position of the grid, in [row]."""
+        for j in range(len(grid)):
+            distance = (grid[j] - position) / width
+            row[j] = weight * math.exp(-distance * distance)
+
+    @numba.njit(parallel=True, nogil=True, cache=True)
+    def gaussian_terms_numba(grid, positions, weights, width):
+        """
+        Gaussian terms of a tile (gaussian_terms_numpy) compiled by Numba.
+
+        The transitions are divided among the threads of Numba (prange) and
+        each term is computed in a single pass, without temporary arrays.
+
+        Parameters
+        ----------
+        grid, positions, weights, width :
+            See gaussian_terms_numpy.
+
+        Returns
+        -------
+        terms : numpy.ndarray
+            Terms of each transition at each position of the grid (transitions x grid).
+
+        """
+        terms = np.empty((len(positions), len(grid)), dtype=grid.dtype)
+        for i in numba.prange(len(positions)):
+            gaussian_row_numba(grid, positions[i], weights[i], width, terms[i])
+
+        return terms
+
+    @numba.njit(nogil=True, cache=True)
+    def gaussian_terms_numba_serial(grid, positions, weights, width):
+        """
+        Gaussian terms of a tile (gaussian_terms_numba) in the calling thread.
+
+        Used by the threads of broaden_direct: a parallel kernel of Numba
+        can not be called from several threads at once (the workqueue
+        layer aborts the process, the others oversubscribe the CPUs).
+
+        Parameters
+        ----------
+        grid, positions, weights, width :
+            See gaussian_terms_numpy.
+
+        Returns
+        -------
+        terms : numpy.ndarray
+            Terms of each transition at each position of the grid (transitions x grid).
+
+        """
+        terms = np.empty((len(positions), len(grid)), dtype=grid.dtype)
+        for i in range(len(positions)):
+            gaussian_row_numba(grid, positions[i], weights[i], width, terms[i])
+
+        return terms
+
+
+@lru_cache(maxsize=None)
+def gaussian_table(cutoff=TABLE_CUTOFF, points_per_width=TABLE_POINTS_PER_WIDTH):
+    """
+    Table of exp(-x**2), x from 0 to [cutoff], for gaussian_terms_table.
+
+    The table is computed once for each (cutoff, points) and shared by all
+    the structures: only the center of the gaussian changes from one
+    transition to another. One zero is added after the cutoff, so every
+    distance beyond it gives zero.
+
+    Parameters
+    ----------
+    cutoff : float
+        Largest distance tabulated, in widths of the gaussian.
+    points_per_width : int
+        Points of the table per width.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        exp(-x**2) at x = k / points_per_width (and the final zero).
+    slopes : numpy.ndarray
+        values[k + 1] - values[k] (zero after the last value).
+
+    """
+    x = np.arange(int(math.ceil(cutoff * points_per_width)) + 1) / points_per_width
+    values = np.append(np.exp(-x**2), 0.0)
+    slopes = np.append(np.diff(values), 0.0)
+    values.flags.writeable = False
+    slopes.flags.writeable = False
+
+    return values, slopes
+
+
+def table_error_bound(cutoff=TABLE_CUTOFF, points_per_width=TABLE_POINTS_PER_WIDTH):
+    """
+    Largest error of the gaussian of gaussian_terms_table, relative to the peak of each line.
+
+    The linear interpolation between points h = 1/points_per_width apart
+    errs by at most h**2/8 * max|f''|, and |f''| = |4x**2 - 2| exp(-x**2)
+    is at most 2 (at x = 0), so h**2/4; the terms beyond [cutoff] add at
+    most exp(-cutoff**2) (truncation_error_bound).
+
+    Parameters
+    ----------
+    cutoff : float
+        Largest distance tabulated, in widths of the gaussian.
+    points_per_width : int
+        Points of the table per width.
+
+    Returns
+    -------
+    error : float
+        h**2/4 + exp(-cutoff**2).
+
+    """
+    return (1.0 / points_per_width)**2 / 4 + truncation_error_bound(cutoff)
+
+
+def gaussian_terms_table(grid, positions, weights, width, cutoff=TABLE_CUTOFF,
+                         points_per_width=TABLE_POINTS_PER_WIDTH, serial=False):
+    """
+    Gaussian terms of a tile (gaussian_terms_numpy) by interpolation in gaussian_table.
+
+    Each term is read from the table (two values and a product) instead
+    of an exp. With Numba the tile is computed by the compiled loop of
+    gaussian_terms_table_numba, in a single pass; otherwise with
+    numpy.take (which, on CPUs where numpy.exp is vectorized, is not
+    faster than exp). The error is at most table_error_bound.
+
+    Parameters
+    ----------
+    grid, positions, weights, width :
+        See gaussian_terms_numpy.
+    cutoff : float
+        Largest distance tabulated, in widths of the gaussian.
+    points_per_width : int
+        Points of the table per width.
+    serial : bool
+        Compute the tile in the calling thread (gaussian_terms_table_numba_serial),
+        for the threads of broaden_direct.
+
+    Returns
+    -------
+    terms : numpy.ndarray
+        Terms of each transition at each position of the grid (transitions x grid).
+
+    """
+    values, slopes = gaussian_table(cutoff, points_per_width)
+    values = values.astype(grid.dtype, copy=False)
+    slopes = slopes.astype(grid.dtype, copy=False)
+    scale = grid.dtype.type(points_per_width / width)
+    if numba is not None:
+        kernel = gaussian_terms_table_numba_serial if serial else gaussian_terms_table_numba
+        return kernel(grid, positions, weights, scale, values, slopes)
+
+    # Position in the table (distances beyond the cutoff go to the final zero)
+    distance = np.subtract(grid, positions[:, np.newaxis])
+    np.abs(distance, out=distance)
+    distance *= scale
+    index = distance.astype(np.intp)
+    distance -= index
+
+    terms = np.take(slopes, index, mode="clip")
+    terms *= distance
+    terms += np.take(values, index, mode="clip")
+    terms *= weights[:, np.newaxis]
+
+    return terms
+
+
+if numba is not None:
+    @numba.njit(nogil=True, cache=True)
+    def table_row_numba(grid, position, weight, scale, values, slopes, row):
+        """Gaussian terms of one transition, interpolated in the table, in [row]."""
+        last = len(values) - 1
+        for j in range(len(grid)):
+            distance = abs(grid[j] - position) * scale
+            if distance >= last:
+                row[j] = 0.0
+            else:
+                k = int(distance)
+                row[j] = weight * (values[k] + (distance - k) * slopes[k])
+
+    @numba.njit(parallel=True, nogil=True, cache=True)
+    def gaussian_terms_table_numba(grid, positions, weights, scale, values, slopes):
+        """
+        Gaussian terms of a tile by interpolation in a table (gaussian_terms_table), compiled by Numba.
+
+        Parameters
+        ----------
+        grid, positions, weights :
+            See gaussian_terms_numpy.
+        scale : float
+            Points of the table per unit of distance (points per width / width).
+        values, slopes : numpy.ndarray
+            Table of gaussian_table.
+
+        Returns
+        -------
+        terms : numpy.ndarray
+            Terms of each transition at each position of the grid (transitions x grid).
+
+        """
+        terms = np.empty((len(positions), len(grid)), dtype=grid.dtype)
+        for i in numba.prange(len(positions)):
+            table_row_numba(grid, positions[i], weights[i], scale, values, slopes, terms[i])
+
+        return terms
+
+    @numba.njit(nogil=True, cache=True)
+    def gaussian_terms_table_numba_serial(grid, positions, weights, scale, values, slopes):
+        """
+        Gaussian terms of a tile (gaussian_terms_table_numba) in the calling thread.
+
+        Used by the threads of broaden_direct, like gaussian_terms_numba_serial.
+
+        Parameters
+        ----------
+        grid, positions, weights, scale, values, slopes :
+            See gaussian_terms_table_numba.
+
+        Returns
+        -------
+        terms : numpy.ndarray
+            Terms of each transition at each position of the grid (transitions x grid).
+
+        """
+        terms = np.empty((len(positions), len(grid)), dtype=grid.dtype)
+        for i in range(len(positions)):
+            table_row_numba(grid, positions[i], weights[i], scale, values, slopes, terms[i])
+
+        return terms
+
+
+def fast_gaussian_mode():
+    """
+    Mode of the gaussian (GAUSSIAN_MODES) for an interactive calculation.
+
+    The table is only faster than numpy.exp when it is compiled by Numba
+    (numpy.take is slower than the vectorized exp of NumPy), so "table"
+    is used only with Numba, and "exp" otherwise.
+
+    Returns
+    -------
+    mode : str
+        "table" or "exp".
+
+    """
+    return "table" if numba is not None else "exp"
+
+
+# Backends of the gaussian terms (only the ones whose library is installed);
+# the one used by broaden_gaussian is chosen by select_backend.
+GAUSSIAN_BACKENDS = {"numpy": gaussian_terms_numpy}
+if numexpr is not None:
+    GAUSSIAN_BACKENDS["numexpr"] = gaussian_terms_numexpr
+if numba is not None:
+    GAUSSIAN_BACKENDS["numba"] = gaussian_terms_numba
+
+# Variants of the backends run by the threads of broaden_direct, each one
+# in its own thread; numexpr has no such variant and runs in one thread of
+# broaden_direct, with its own threads.
+GAUSSIAN_SERIAL_BACKENDS = {"numpy": gaussian_terms_numpy}
+if numba is not None:
+    GAUSSIAN_SERIAL_BACKENDS["numba"] = gaussian_terms_numba_serial
+
+# Backend selected in this process (select_backend)
+gaussian_backend = None
+
+
+def calibrate_backends(n_states=1024, n_grid=1024, repeat=3):
+    """
+    Time the backends of GAUSSIAN_BACKENDS on a tile of the size of broaden_direct.
+
+    Each backend is run once before being timed (Numba compiles the
+    kernel in the first call), and is discarded if its terms differ from
+    the NumPy reference by more than 1e-12 (relative).
+
+    Parameters
+    ----------
+    n_states : int
+        Transitions of the tile.
+    n_grid : int
+        Positions of the grid of the tile.
+    repeat : int
+        Number of runs of each backend (the fastest one counts).
+
+    Returns
+    -------
+    timings : dict
+        Time (s) of each backend that gave the right terms.
+
+    """
+    rng = np.random.default_rng(0)
+    width = FACT2/SIGMA
+    grid = 1.0 / np.linspace(100.0, 800.0, n_grid)
+    positions = 1.0 / rng.uniform(100.0, 800.0, n_states)
+    weights = A * (rng.uniform(0.0, 1.0, n_states) / (FACT1/SIGMA))
+    reference = gaussian_terms_numpy(grid, positions, weights, width)
+    scale = float(np.max(np.abs(reference)))
+
+    timings = {}
+    for name, kernel in GAUSSIAN_BACKENDS.items():
+        try:
+            terms = kernel(grid, positions, weights, width)
+        except Exception as msg_err:
+            print(f" + Backend {name} não disponível: {msg_err}")
+            continue
+        if float(np.max(np.abs(terms - reference))) > 1e-12 * scale:
+            print(f" + Backend {name} ignorado: resultado diferente do numpy")
+            continue
+
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            kernel(grid, positions, weights, width)
+            elapsed.append(time.perf_counter() - start)
+        timings[name] = min(elapsed)
+
+    return timings
+
+
+def select_backend(name=None):
+    """
+    Backend of the gaussian broadening (GAUSSIAN_BACKENDS).
+
+    [name], or else the environment variable BACKEND_ENV, forces a
+    backend. Otherwise the backend is chosen once per process: the choice
+    kept in BACKEND_FILE (home directory) for this machine and these
+    backends is used, or calibrate_backends measures them and the fastest
+    one is kept there.
+
+    Parameters
+    ----------
+    name : str
+        Backend to be used ("auto" or None to choose it).
+
+    Returns
+    -------
+    name : str
+        Backend selected.
+
+    """
+    global gaussian_backend
+
+    name = name or os.environ.get(BACKEND_ENV) or "auto"
+    if name != "auto":
+        if name not in GAUSSIAN_BACKENDS:
+            raise ValueError(f"backend ({name}) não disponível, use um de "
+                             f"({', '.join(GAUSSIAN_BACKENDS)})")
+        gaussian_backend = name
+        return gaussian_backend
+    if gaussian_backend is not None:
+        return gaussian_backend
+    if len(GAUSSIAN_BACKENDS) == 1:
+        gaussian_backend = next(iter(GAUSSIAN_BACKENDS))
+        return gaussian_backend
+
+    # Choice kept for this machine, if it was made with the same backends
+    file_name = Path.home() / BACKEND_FILE
+    machine = platform.node()
+    try:
+        with open(file_name) as f_backend:
+            choices = json.load(f_backend)
+    except (OSError, ValueError):
+        choices = {}
+    choice = choices.get(machine, {})
+    if choice.get("backend") in GAUSSIAN_BACKENDS and choice.get("available") == list(GAUSSIAN_BACKENDS):
+        gaussian_backend = choice["backend"]
+        return gaussian_backend
+
+    timings = calibrate_backends()
+    gaussian_backend = min(timings, key=timings.get)
+    print(" - Backends da gaussiana: " + ", ".join(f"{backend} {elapsed:.4f} s"
+                                                   for backend, elapsed in timings.items())
+          + f"; usando {gaussian_backend}")
+
+    choices[machine] = {"backend": gaussian_backend, "available": list(GAUSSIAN_BACKENDS),
+                        "timings": timings}
+    try:
+        with open(file_name, "w") as f_backend:
+            json.dump(choices, f_backend, indent=2)
+    except OSError as msg_err:
+        print(f" + Escolha do backend não salva ({file_name}): {msg_err}")
+
+    return gaussian_backend
+
+
+def broaden_direct(counts, positions, weights, grid_positions, line_shape,
+                   max_bytes=MAX_BROADEN_BYTES, kernel=None, threads=1, dtype=np.float64):
+    """
+    Broaden the transitions of an ensemble, evaluating every term with NumPy.
+
+    The terms are evaluated in arrays (states x positions) instead of one
+    call to math.exp per term. The ensemble is evaluated in tiles of several
+    structures by several positions (broadening_tiles), so the temporary
+    arrays never take more than about [max_bytes], however large the
+    ensemble and the grid are; the terms of each structure are then added
+    with numpy.add.reduceat.
+
+    With several [threads], the tiles are evaluated by a ThreadPoolExecutor
+    (NumPy releases the GIL in exp and in the arithmetic, so there is no
+    pickling as with processes) and each one is added directly into its own
+    slice of the result; the memory of the temporary arrays is divided
+    among the threads. The [kernel] must then run in the calling thread
+    (GAUSSIAN_SERIAL_BACKENDS).
+
+    Parameters
+    ----------
+    counts : array
+        Number of transitions of each structure.
+    positions : array
+        Position of each transition, in the space where the line shape is
+        evaluated (for example, 1/nm).
+    weights : array
+        Height of the line of each transition.
+    grid_positions : array
+        Positions where the spectra are calculated (same space).
+    line_shape : function
+        Line shape as a function of the distance to the transition (an
+        array it may overwrite), with height 1 at zero.
+    max_bytes : int
+        Memory (bytes) of the temporary arrays (MAX_BROADEN_BYTES).
+    kernel : function
+        Weighted terms of a tile, kernel(grid, positions, weights)
+        (transitions x grid), used instead of [line_shape] (for example, a
+        backend of GAUSSIAN_BACKENDS).
+    threads : int
+        Number of threads (None, all the CPUs of available_cpus).
+    dtype : numpy.dtype
+        Type of the terms and of the spectra (PRECISIONS).
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x positions).
+
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=dtype)
+    weights = np.asarray(weights, dtype=dtype)
+    grid = np.asarray(grid_positions, dtype=dtype)
+    offsets = structure_offsets(counts)
+
+    threads = available_cpus() if threads is None else max(1, int(threads))
+
+    spectra = np.zeros((len(counts), len(grid)), dtype=dtype)
+    if threads > 1:
+        # At least a few tiles per thread, within the memory of each thread
+        total_bytes = int(offsets[-1]) * len(grid) * np.dtype(dtype).itemsize
+        max_bytes = max(min(int(max_bytes) // threads, total_bytes // (4 * threads)), 2**16)
+    structures, grid_blocks = broadening_tiles(counts, len(grid), max_bytes, dtype)
+
+    def broaden_tile(tile):
+        (first, last), (g_first, g_last) = tile
+        # numpy.add.reduceat does not give zero for a structure without states
+        nonempty = np.flatnonzero(counts[first:last]) + first
+        if len(nonempty) == 0:
+            return
+        start, end = offsets[first], offsets[last]
+        rows = offsets[nonempty] - start
+
+        if kernel is not None:
+            terms = kernel(grid[g_first:g_last], positions[start:end], weights[start:end])
+        else:
+            terms = line_shape(np.subtract(grid[g_first:g_last], positions[start:end, np.newaxis]))
+            terms *= weights[start:end, np.newaxis]
+        if len(nonempty) == last - first:
+            # Sums written in place, in the slice of the tile
+            np.add.reduceat(terms, rows, axis=0, out=spectra[first:last, g_first:g_last])
+        else:
+            spectra[nonempty, g_first:g_last] = np.add.reduceat(terms, rows, axis=0)
+
+    tiles = [(structure, block) for structure in structures for block in grid_blocks]
+    if threads == 1:
+        for tile in tiles:
+            broaden_tile(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # Tiles write disjoint slices of [spectra]; list() raises their errors
+            list(executor.map(broaden_tile, tiles))
+
+    return spectra
+
+
+def gaussian_parameters(strengths, width=GAUSSIAN_WIDTH):
+    """
+    Width (1/nm) and heights of the gaussian lines of fit_gaussian.
+
+    With the default [width] these are the constants of the formula,
+    FACT2/SIGMA and A * f/(FACT1/SIGMA); another width keeps the area of
+    each line (A * f/sigma, with the width sigma in cm-1).
+
+    Parameters
+    ----------
+    strengths : array
+        Oscillator strengths.
+    width : float
+        Width (1/e half width) of the gaussian (eV).
+
+    Returns
+    -------
+    width : float
+        Width of the gaussian (1/nm).
+    weights : numpy.ndarray
+        Height of the line of each transition.
+
+    """
+    if width <= 0:
+        raise ValueError(f"largura da gaussiana inválida ({width})")
+
+    strengths = np.asarray(strengths, dtype=np.float64)
+    if width == GAUSSIAN_WIDTH:
+        return FACT2/SIGMA, A * (strengths / (FACT1/SIGMA))
+
+    sigma = width * EV_TO_CM
+    return sigma / FACT1, A * (strengths / sigma)
+
+
+def broaden_gaussian(counts, wavelengths, strengths, wave_numbers, max_bytes=MAX_BROADEN_BYTES,
+                     width=GAUSSIAN_WIDTH, threads=1, dtype=np.float64, mode="exp"):
+    """
+    Gaussian spectra of the structures of an ensemble, evaluated with NumPy.
+
+    The formula is the same of fit_gaussian (constants A, FACT1, FACT2 and
+    SIGMA, see gaussian_parameters), evaluated in tiles of the ensemble by
+    broaden_direct with the backend of select_backend.
+
+    Parameters
+    ----------
+    counts : array
+        Number of excited states of each structure.
+    wavelengths : array
+        Wavelengths (nm) of all the states, structure after structure.
+    strengths : array
+        Oscillator strengths of all the states.
+    wave_numbers : array
+        Wavenumbers (nm) where the spectra are calculated.
+    max_bytes : int
+        Memory (bytes) of the temporary arrays (MAX_BROADEN_BYTES).
+    width : float
+        Width (1/e half width) of the gaussian (eV).
+    threads : int
+        Threads of broaden_direct (None, all the CPUs available). With
+        several threads each one runs the serial variant of the backend
+        (GAUSSIAN_SERIAL_BACKENDS); numexpr runs in one thread with its own.
+    dtype : numpy.dtype
+        Type of the terms and of the spectra (PRECISIONS); the positions
+        and heights are computed in float64 and then converted.
+    mode : str
+        "exp" (the backend of select_backend) or "table" (interpolation
+        in a table of exp(-x**2), gaussian_terms_table), see GAUSSIAN_MODES.
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+
+    """
+    wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64)
+    if np.any(wave_numbers == 0) or np.any(wavelengths == 0):
+        raise ZeroDivisionError("comprimento de onda igual a zero")
+
+    threads = available_cpus() if threads is None else max(1, int(threads))
+    width, weights = gaussian_parameters(strengths, width)
+    if mode == "table":
+        kernel = partial(gaussian_terms_table, serial=threads > 1)
+    elif mode == "exp":
+        backend = select_backend()
+        if backend not in GAUSSIAN_SERIAL_BACKENDS:
+            threads = 1
+        kernel = (GAUSSIAN_SERIAL_BACKENDS if threads > 1 else GAUSSIAN_BACKENDS)[backend]
+    else:
+        raise ValueError(f"modo da gaussiana inválido ({mode})")
+    return broaden_direct(counts, 1.0 / wavelengths, weights, 1.0 / wave_numbers,
+                          partial(gaussian_line, width=width), max_bytes,
+                          partial(kernel, width=width), threads, dtype)
+
+
+def broaden_gaussian_scalar(counts, wavelengths, strengths, wave_numbers):
+    """
+    Gaussian spectra of the structures of an ensemble, one term at a time.
+
+    Reference for broaden_gaussian: the loops over structures, wavenumbers
+    and states, with math.exp, of the original fit_gaussian.
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+
+    """
+    offsets = structure_offsets(counts).tolist()
+    wavelengths = np.asarray(wavelengths, dtype=np.float64).tolist()
+    strengths = np.asarray(strengths, dtype=np.float64).tolist()
+
+    spectra = np.zeros((len(counts), len(wave_numbers)))
+    for j in range(0, len(counts)):
+        for k, nm_valor in enumerate(wave_numbers):
+            spectrum = 0.0
+            for i in range(offsets[j], offsets[j+1]):
+                spectrum = spectrum + A * (strengths[i] / (FACT1/SIGMA)) * \
+                    math.exp(-(((1.0/nm_valor) - (1.0/wavelengths[i]))/(FACT2/SIGMA))**2)
+            spectra[j, k] = spectrum
+
+    return spectra
+
+
+def benchmark_broadening(counts, wavelengths, strengths, wave_numbers, repeat=1):
+    """
+    Compare the time and the results of broaden_gaussian and broaden_gaussian_scalar.
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    repeat : int
+        Number of times each version is run (the best time is used).
+
+    Returns
+    -------
+    result : dict
+        Times (s) of the "scalar" and "numpy" versions, the "speedup" and
+        the largest relative difference between them ("max_rel_diff").
+
+    """
+    result = {}
+    spectra = {}
+    for name, function in (("scalar", broaden_gaussian_scalar), ("numpy", broaden_gaussian)):
+        elapsed = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            spectra[name] = function(counts, wavelengths, strengths, wave_numbers)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        result[name] = elapsed
+        print(f" - Broadening {name:<6}: {elapsed:10.4f} s")
+
+    result["speedup"] = result["scalar"] / result["numpy"] if result["numpy"] > 0 else float("inf")
+    scale = np.maximum(np.abs(spectra["scalar"]), np.finfo(np.float64).tiny)
+    result["max_rel_diff"] = float(np.max(np.abs(spectra["numpy"] - spectra["scalar"]) / scale,
+                                          initial=0.0))
+    print(f" - Speedup {result['speedup']:.1f}x, maximum relative difference "
+          f"{result['max_rel_diff']:.3e}")
+
+    return result
+
+
+def broaden_fft(counts, positions, weights, grid_positions, line_shape, bin_width, support,
+                max_bytes=MAX_BROADEN_BYTES):
+    """
+    Broaden the transitions of an ensemble by a convolution (FFT) on a uniform grid.
+
+    The weights of the transitions are distributed between the two nearest
+    bins of a uniform grid (linear binning, with numpy.bincount), the
+    histogram of each structure is convolved once with the line shape
+    (numpy.fft.rfft), and the result is interpolated (numpy.interp) at the
+    requested positions. The cost is about transitions + G log G per
+    structure, G being the number of bins, instead of transitions x grid.
+    The result is exact up to the binning and the interpolation, whose
+    error falls with the square of [bin_width] (see fft_accuracy).
+
+    Parameters
+    ----------
+    counts : array
+        Number of transitions of each structure.
+    positions : array
+        Position of each transition, in the space where the line shape is
+        evaluated (for example, 1/nm).
+    weights : array
+        Height of the line of each transition.
+    grid_positions : array
+        Positions where the spectra are calculated (same space).
+    line_shape : function
+        Line shape as a function of the distance to the transition, with
+        height 1 at zero.
+    bin_width : float
+        Width of the bins of the uniform grid.
+    support : float
+        Transitions farther than this from the grid are left out.
+    max_bytes : int
+        Memory (bytes) of the temporary arrays.
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x positions).
+
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    grid_positions = np.asarray(grid_positions, dtype=np.float64)
+
+    spectra = np.zeros((len(counts), len(grid_positions)))
+    if len(grid_positions) == 0 or len(counts) == 0:
+        return spectra
+
+    # Uniform grid that covers the requested positions and the transitions
+    # within the support around them
+    low, high = grid_positions.min(), grid_positions.max()
+    if len(positions) > 0:
+        low = min(low, max(low - support, positions.min()))
+        high = max(high, min(high + support, positions.max()))
+    origin = low - bin_width
+    n_bins = int(math.ceil((high - origin) / bin_width)) + 2
+    centers = origin + bin_width * np.arange(n_bins)
+
+    # Line shape at all the distances between two bins (circular order), and
+    # FFT size large enough to make the circular convolution a linear one
+    n_fft = 1 << int(2 * n_bins - 1).bit_length()
+    distance = np.arange(n_fft)
+    distance = np.where(distance < n_fft // 2, distance, distance - n_fft) * bin_width
+    kernel = np.fft.rfft(line_shape(distance))
+
+    # Linear binning: each transition is split between the bins j and j+1
+    position = (positions - origin) / bin_width
+    inside = (position >= 0) & (position <= n_bins - 1)
+    bins = np.minimum(np.floor(position), n_bins - 2).astype(np.int64)
+    fraction = position - bins
+    structure = np.repeat(np.arange(len(counts)), counts)
+
+    # Structures of each block: histograms and their transforms (about 3 arrays of n_fft)
+    offsets = structure_offsets(counts)
+    block = max(1, int(max_bytes) // (24 * n_fft))
+    for first in range(0, len(counts), block):
+        last = min(first + block, len(counts))
+        start, end = offsets[first], offsets[last]
+        selected = np.flatnonzero(inside[start:end]) + start
+
+        index = (structure[selected] - first) * n_fft + bins[selected]
+        histogram = np.bincount(np.concatenate((index, index + 1)),
+                                weights=np.concatenate((weights[selected] * (1.0 - fraction[selected]),
+                                                        weights[selected] * fraction[selected])),
+                                minlength=(last - first) * n_fft).reshape(last - first, n_fft)
+
+        convolution = np.fft.irfft(np.fft.rfft(histogram, axis=1) * kernel, n_fft, axis=1)
+        for j in range(first, last):
+            spectra[j] = np.interp(grid_positions, centers, convolution[j - first, :n_bins])
+
+    return spectra
+
+
+def broaden_gaussian_fft(counts, wavelengths, strengths, wave_numbers,
+                         bins_per_width=FFT_BINS_PER_WIDTH, cutoff=FFT_GAUSSIAN_CUTOFF,
+                         max_bytes=MAX_BROADEN_BYTES, width=GAUSSIAN_WIDTH):
+    """
+    Gaussian spectra of an ensemble by a convolution on a uniform 1/nm grid (broaden_fft).
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    bins_per_width : float
+        Bins of the uniform grid per width (FACT2/SIGMA) of the gaussian.
+    cutoff : float
+        Transitions farther than [cutoff] widths from the grid are left out.
+    max_bytes : int
+        Memory (bytes) of the temporary arrays.
+    width : float
+        Width (1/e half width) of the gaussian (eV).
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+
+    """
+    wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64)
+    if np.any(wave_numbers == 0) or np.any(wavelengths == 0):
+        raise ZeroDivisionError("comprimento de onda igual a zero")
+
+    width, weights = gaussian_parameters(strengths, width)
+    return broaden_fft(counts, 1.0 / wavelengths, weights,
+                       1.0 / wave_numbers, partial(gaussian_line, width=width),
+                       width / bins_per_width, cutoff * width, max_bytes)
+
+
+def fft_accuracy(counts, wavelengths, strengths, wave_numbers,
+                 bins_per_width=(2, 4, 8, 16, 32, 64)):
+    """
+    Accuracy of the FFT engine (broaden_gaussian_fft) as a function of the width of the bins.
+
+    The spectra of each width of the bins are compared with the direct
+    evaluation (broaden_gaussian); the error is relative to the highest
+    value of the spectra.
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    bins_per_width : list
+        Bins per width of the gaussian to be tested.
+
+    Returns
+    -------
+    report : list
+        (bins per width, width of the bin in 1/nm, maximum relative error,
+        time in s) of each value of [bins_per_width].
+
+    """
+    start = time.perf_counter()
+    direct = broaden_gaussian(counts, wavelengths, strengths, wave_numbers)
+    elapsed = time.perf_counter() - start
+    scale = max(float(np.max(np.abs(direct), initial=0.0)), np.finfo(np.float64).tiny)
+    print(f" - Direct evaluation: {elapsed:10.4f} s")
+
+    report = []
+    for bins in bins_per_width:
+        start = time.perf_counter()
+        spectra = broaden_gaussian_fft(counts, wavelengths, strengths, wave_numbers, bins)
+        elapsed = time.perf_counter() - start
+        error = float(np.max(np.abs(spectra - direct), initial=0.0)) / scale
+        report.append((bins, FACT2/SIGMA/bins, error, elapsed))
+        print(f" - FFT, {bins:4} bins per width (bin of {FACT2/SIGMA/bins:.3e} 1/nm): "
+              f"maximum relative error {error:.3e}, {elapsed:10.4f} s")
+
+    return report
+
+
+def gaussian_profile(distance, width):
+    """
+    Gaussian of area 1, exp(-(distance/width)**2) / (width*sqrt(pi)), computed in place.
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition (overwritten with the result).
+    width : float
+        1/e half width (same unit of [distance]).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Values of the line shape.
+
+    """
+    distance = gaussian_line(distance, width)
+    distance /= width * math.sqrt(math.pi)
+
+    return distance
+
+
+def lorentzian_profile(distance, hwhm):
+    """
+    Lorentzian of area 1, (hwhm/pi) / (distance**2 + hwhm**2), computed in place.
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition (overwritten with the result).
+    hwhm : float
+        Half width at half maximum (same unit of [distance]).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Values of the line shape.
+
+    """
+    distance = lorentzian_line(distance, hwhm)
+    distance /= math.pi * hwhm
+
+    return distance
+
+
+def faddeeva(z, n_terms=FADDEEVA_TERMS):
+    """
+    Faddeeva function, w(z) = exp(-z**2) * erfc(-1j*z), for Im(z) > 0.
+
+    scipy.special.wofz is used when scipy is installed; otherwise w(z) is
+    given by the rational approximation of Weideman (SIAM J. Numer. Anal.
+    31, 1497, 1994) with [n_terms] terms, whose relative error is below
+    about 1e-12 in the upper half plane with 32 terms.
+
+    Parameters
+    ----------
+    z : array
+        Points of the upper half plane.
+    n_terms : int
+        Terms of the rational approximation.
+
+    Returns
+    -------
+    w : numpy.ndarray
+        w(z) (complex).
+
+    """
+    z = np.asarray(z, dtype=np.complex128)
+    if wofz is not None:
+        return wofz(z)
+
+    # Coefficients of the expansion (FFT of exp(-t**2) * (L**2 + t**2) on t = L tan(theta/2))
+    m = 2 * n_terms
+    scale = math.sqrt(n_terms / math.sqrt(2))
+    t = scale * np.tan(np.arange(-m + 1, m) * math.pi / (2 * m))
+    f = np.concatenate(([0.0], np.exp(-t**2) * (scale**2 + t**2)))
+    coefficients = np.real(np.fft.fft(np.fft.fftshift(f))) / (2 * m)
+    coefficients = coefficients[n_terms:0:-1]
+
+    denominator = scale - 1j * z
+    p = np.polyval(coefficients, (scale + 1j * z) / denominator)
+
+    return 2 * p / denominator**2 + (1 / math.sqrt(math.pi)) / denominator
+
+
+def voigt_profile(distance, width, hwhm):
+    """
+    Voigt profile of area 1: convolution of a gaussian and a lorentzian.
+
+    Computed as Re w(z) / (width*sqrt(pi)), z = (distance + 1j*hwhm)/width
+    (see faddeeva); it is the gaussian_profile when [hwhm] goes to zero
+    and the lorentzian_profile when [width] goes to zero.
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition.
+    width : float
+        1/e half width of the gaussian (same unit of [distance]).
+    hwhm : float
+        Half width at half maximum of the lorentzian (same unit of [distance]).
+
+    Returns
+    -------
+    profile : numpy.ndarray
+        Values of the line shape.
+
+    """
+    z = (np.asarray(distance, dtype=np.float64) + 1j * hwhm) / width
+
+    return faddeeva(z).real / (width * math.sqrt(math.pi))
+
+
+def pseudo_voigt_profile(distance, hwhm, eta):
+    """
+    Pseudo-Voigt profile of area 1: eta * lorentzian + (1 - eta) * gaussian.
+
+    The lorentzian and the gaussian have the same half width at half maximum
+    [hwhm] (the 1/e half width of the gaussian is hwhm/sqrt(ln 2)).
+
+    Parameters
+    ----------
+    distance : numpy.ndarray
+        Distances to the transition (overwritten with the result).
+    hwhm : float
+        Half width at half maximum (same unit of [distance]).
+    eta : float
+        Fraction of the lorentzian (0 to 1).
+
+    Returns
+    -------
+    distance : numpy.ndarray
+        Values of the line shape.
+
+    """
+    lorentzian = lorentzian_profile(np.array(distance, dtype=np.float64), hwhm)
+    distance = gaussian_profile(distance, hwhm / math.sqrt(math.log(2)))
+    distance *= 1.0 - eta
+    lorentzian *= eta
+    distance += lorentzian
+
+    return distance
+
+
+def voigt_half_width(width, hwhm):
+    """
+    Half width at half maximum (eV) of the Voigt profile.
+
+    Approximation of Olivero and Longbothum (J. Quant. Spectrosc. Radiat.
+    Transfer 17, 233, 1977), better than 0.02 %.
+
+    Parameters
+    ----------
+    width : float
+        1/e half width of the gaussian (eV).
+    hwhm : float
+        Half width at half maximum of the lorentzian (eV).
+
+    Returns
+    -------
+    half_width : float
+        Half width at half maximum (eV).
+
+    """
+    gaussian = width * math.sqrt(math.log(2))
+
+    return 0.5346 * hwhm + math.sqrt(0.2166 * hwhm**2 + gaussian**2)
+
+
+# Line shapes of the fit: the parameters of each one (unit "eV", or a
+# fraction when there is no unit), its half width at half maximum and its
+# support (distance where it falls below [tolerance] of its peak), in eV,
+# the profile of area 1 in 1/nm (and, optionally, a dedicated function of
+# the direct engine), and the files of fit_line_shape.
+LINE_SHAPES = {
+    "gaussian": {
+        "label": "Gaussian",
+        "params": {"width": {"default": GAUSSIAN_WIDTH, "unit": "eV",
+                             "help": "1/e half width of the gaussian"}},
+        "half_width": lambda width: width * math.sqrt(math.log(2)),
+        "support": lambda tolerance, width: width * math.sqrt(-math.log(tolerance)),
+        "profile": gaussian_profile,
+        # Direct engine: the formula of fit_gaussian, with the backends of select_backend
+        "broaden": broaden_gaussian,
+        "files": ("spectrum_gaussian.dat", "average_spectrum.dat"),
+        "decimals": 10,
+    },
+    "lorentzian": {
+        "label": "Lorentzian",
+        "params": {"hwhm": {"default": LORENTZIAN_HWHM, "unit": "eV",
+                            "help": "half width at half maximum of the lorentzian"}},
+        "half_width": lambda hwhm: hwhm,
+        "support": lambda tolerance, hwhm: hwhm * math.sqrt(1.0 / tolerance - 1.0),
+        "profile": lorentzian_profile,
+        "files": ("spectrum_lorentzian.dat", "average.dat"),
+        "decimals": 12,
+    },
+    "voigt": {
+        "label": "Voigt",
+        "params": {"width": {"default": GAUSSIAN_WIDTH, "unit": "eV",
+                             "help": "1/e half width of the gaussian"},
+                   "hwhm": {"default": LORENTZIAN_HWHM, "unit": "eV",
+                            "help": "half width at half maximum of the lorentzian"}},
+        "half_width": voigt_half_width,
+        # The wings of the lorentzian widened by the gaussian (conservative)
+        "support": lambda tolerance, width, hwhm: (width * math.sqrt(-math.log(tolerance))
+                                                   + hwhm * math.sqrt(1.0 / tolerance - 1.0)),
+        "profile": voigt_profile,
+        "files": ("spectrum_voigt.dat", "average_voigt.dat"),
+        "decimals": 12,
+    },
+    "pseudo_voigt": {
+        "label": "Pseudo-Voigt",
+        "params": {"hwhm": {"default": LORENTZIAN_HWHM, "unit": "eV",
+                            "help": "half width at half maximum"},
+                   "eta": {"default": PSEUDO_VOIGT_ETA, "unit": "",
+                           "help": "fraction of the lorentzian (0 to 1)"}},
+        "half_width": lambda hwhm, eta: hwhm,
+        "support": lambda tolerance, hwhm, eta: (
+            hwhm * max(math.sqrt(-math.log(tolerance) / math.log(2)),
+                       math.sqrt(1.0 / tolerance - 1.0) if eta > 0 else 0.0)),
+        "profile": pseudo_voigt_profile,
+        "files": ("spectrum_pseudo_voigt.dat", "average_pseudo_voigt.dat"),
+        "decimals": 12,
+    },
+}
+
+
+def line_shape_params(name, params=None):
+    """
+    Parameters of a line shape of LINE_SHAPES, with the defaults of the registry.
+
+    Parameters
+    ----------
+    name : str
+        Name of the line shape (key of LINE_SHAPES).
+    params : dict
+        Values of some parameters; the ones the line shape does not declare
+        are ignored.
+
+    Returns
+    -------
+    values : dict
+        Value of each parameter of the line shape.
+
+    """
+    if name not in LINE_SHAPES:
+        raise ValueError(f"forma de linha desconhecida ({name})")
+
+    params = params or {}
+    values = {}
+    for param, spec in LINE_SHAPES[name]["params"].items():
+        value = float(params.get(param, spec["default"]))
+        if spec["unit"] == "eV" and not value > 0:
+            raise ValueError(f"parâmetro {param} de {name} inválido ({value})")
+        if spec["unit"] == "" and not 0 <= value <= 1:
+            raise ValueError(f"parâmetro {param} de {name} fora de [0, 1] ({value})")
+        values[param] = value
+
+    return values
+
+
+def broaden_line_shape(name, counts, wavelengths, strengths, wave_numbers, params=None,
+                       engine="direct", bins_per_width=FFT_BINS_PER_WIDTH,
+                       max_bytes=MAX_BROADEN_BYTES, threads=1, mode="exp"):
+    """
+    Spectra of the structures of an ensemble with a line shape of LINE_SHAPES.
+
+    The profile of area 1 of the line shape is evaluated in the same space
+    of the gaussian (1/nm), with the widths given in eV, and each line has
+    the area of the gaussian of the same transition, A*sqrt(pi)*f (in cm-1).
+
+    Parameters
+    ----------
+    name : str
+        Name of the line shape (key of LINE_SHAPES).
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    params : dict
+        Parameters of the line shape (see line_shape_params).
+    engine : str
+        "direct" (broaden_direct) or "fft" (broaden_fft, transitions within
+        the support of the line shape at LINE_SUPPORT_TOLERANCE).
+    bins_per_width : float
+        Bins of the uniform grid per half width at half maximum (engine "fft").
+    max_bytes : int
+        Memory (bytes) of the temporary arrays.
+    threads : int
+        Threads of the direct engine (None, all the CPUs available).
+    mode : str
+        Kernel of the dedicated direct function of the line shape, if it has
+        one (the gaussian, see GAUSSIAN_MODES).
+
+    Returns
+    -------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+
+    """
+    params = line_shape_params(name, params)
+    shape = LINE_SHAPES[name]
+
+    wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+    wavelengths = np.asarray(wavelengths, dtype=np.float64)
+    if np.any(wave_numbers == 0) or np.any(wavelengths == 0):
+        raise ZeroDivisionError("comprimento de onda igual a zero")
+
+    # Widths in eV -> 1/nm
+    scale = EV_TO_CM / FACT1
+    profile = partial(shape["profile"], **{param: value * scale if shape["params"][param]["unit"]
+                                           else value for param, value in params.items()})
+    weights = A * math.sqrt(math.pi) / FACT1 * np.asarray(strengths, dtype=np.float64)
+
+    if engine == "fft":
+        bin_width = shape["half_width"](**params) * scale / bins_per_width
+        support = shape["support"](LINE_SUPPORT_TOLERANCE, **params) * scale
+        return broaden_fft(counts, 1.0 / wavelengths, weights, 1.0 / wave_numbers, profile,
+                           bin_width, support, max_bytes)
+
+    if "broaden" in shape:
+        return shape["broaden"](counts, wavelengths, strengths, wave_numbers, max_bytes,
+                                threads=threads, mode=mode, **params)
+
+    return broaden_direct(counts, 1.0 / wavelengths, weights, 1.0 / wave_numbers, profile,
+                          max_bytes, threads=threads)
+
+
+def fit_gaussian(type_of_average, wave_numbers, max_bytes=MAX_BROADEN_BYTES, cutoff=None,
+                 engine="direct", bins_per_width=FFT_BINS_PER_WIDTH, width=GAUSSIAN_WIDTH,
+                 threads=1, precision="float64", mode="exp"):
+    """
+    Ajuste gaussian.
+
+    Os espectros de todas as estruturas são calculados com broaden_gaussian.
+
+    Parameters
+    ----------
+    type_of_average : TYPE
+        DESCRIPTION.
+    wave_numbers : TYPE
+        DESCRIPTION.
+    max_bytes : int
+        Memória (bytes) dos arrays temporários do cálculo dos espectros.
+    cutoff : float
+        Cada transição é calculada só até [cutoff] larguras do seu pico
+        (broaden_gaussian_window); None calcula todos os termos.
+    engine : str
+        "direct" (cálculo de cada termo) ou "fft" (convolução em uma grade
+        uniforme, broaden_gaussian_fft).
+    bins_per_width : float
+        Pontos da grade uniforme por largura da gaussiana (engine "fft").
+    width : float
+        Largura (meia largura a 1/e) da gaussiana (eV).
+    threads : int
+        Threads do cálculo direto (None, todas as CPUs disponíveis).
+    precision : str
+        "float64" ou "float32" (PRECISIONS): em float32, o cálculo direto e a
+        média (pairwise_sum) usam metade da memória, e o desvio em relação a
+        float64 é calculado e mostrado (float32_deviation).
+    mode : str
+        "exp" ou "table" (GAUSSIAN_MODES): no cálculo direto, "table" interpola
+        cada termo em uma tabela de exp(-x**2), com o erro de table_error_bound.
+
+    Returns
+    -------
+    None.
+
+    """
+    try:
+        _, counts, wavelengths, strengths = load_input()
+        # m_valor representa a quantidade de estruturas que terão os espectros UV-VIS calculados
+        m_valor = len(counts)
+        if m_valor == 0:
+            raise ValueError("nenhuma estrutura no arquivo de entrada")
+
+        if type_of_average == 'aritmética' and engine == "fft":
+            spectra = broaden_gaussian_fft(counts, wavelengths, strengths, wave_numbers,
+                                           bins_per_width, max_bytes=max_bytes, width=width)
+        elif type_of_average == 'aritmética' and cutoff is not None:
+            spectra = broaden_gaussian_window(counts, wavelengths, strengths, wave_numbers, cutoff,
+                                              max_bytes, width=width)
+            print(f" - Gaussiana truncada em {cutoff} larguras: erro relativo máximo "
+                  f"{truncation_error_bound(cutoff):.3e} (do pico de cada transição)")
+        elif type_of_average == 'aritmética':
+            spectra = broaden_gaussian(counts, wavelengths, strengths, wave_numbers, max_bytes,
+                                       width, threads, np.dtype(precision), mode)
+            if mode == "table":
+                print(f" - Gaussiana tabelada ({TABLE_POINTS_PER_WIDTH} pontos por largura, até "
+                      f"{TABLE_CUTOFF} larguras): erro relativo máximo "
+                      f"{table_error_bound():.3e} (do pico de cada transição)")
+        else:
+            spectra = np.zeros((m_valor, len(wave_numbers)))
+
+        # Opções só do cálculo direto, sem efeito na janela (cutoff) e na fft
+        if type_of_average == 'aritmética' and (engine == "fft" or cutoff is not None):
+            ignored = [f"{name}={value}" for name, value, default in
+                       (("threads", threads, 1), ("precision", precision, "float64"),
+                        ("mode", mode, "exp")) if value != default]
+            if ignored:
+                print(f" + {', '.join(ignored)} só no cálculo direto, ignorado(s) com "
+                      f"{'--engine fft' if engine == 'fft' else '--cutoff'}")
+
+        # Dados de todas as estruturas, escritos por blocos (sem cópias do tamanho dos espectros)
+        with open("spectrum_gaussian.dat", "w") as f_spectrum_gaussian, \
+                open("dados_spectrum.txt", "w") as f_dados:
+            write_spectra(f_spectrum_gaussian, wave_numbers, spectra, max_bytes, f_dados=f_dados)
+        print("")
+        print("Aquivo spectrum_gaussian.dat gerado!")
+
+        # Calculating and saving average (compensated in float32)
+        if spectra.dtype == np.float64:
+            average = spectra.sum(axis=0)
+        else:
+            average = pairwise_sum(spectra, max_bytes)
+        if type_of_average == 'aritmética':
+            average = average / m_valor
+
+        if spectra.dtype != np.float64 and type_of_average == 'aritmética':
+            deviation = float32_deviation(counts, wavelengths, strengths, wave_numbers, spectra,
+                                          average, max_bytes, width, threads)
+            print(f" - {spectra.dtype}: desvio máximo em relação a float64 de "
+                  f"{deviation['spectra']:.3e} nos espectros e {deviation['average']:.3e} na "
+                  f"média (relativos ao maior valor)")
+
+        with open("average_spectrum.dat", "w") as f_average:
+            for key, value in zip(wave_numbers, average.tolist()):
+                f_average.write(f"{key:<4f}   {value:>6.10f}\n")
+        print("Arquivo average_spectrum.dat gerado!")
+
+        # Médias
+        medias_spectrum = np.column_stack((wave_numbers, average))
+        np.savetxt("medias.txt", medias_spectrum, fmt="%6.10f", delimiter=";")
+    except (OSError, ValueError) as msg_err:
+        print(f"Erro: {msg_err}")
+    except ZeroDivisionError as msg_err:
+        print(f"Divisão por zero: {msg_err}")
+
+
+def write_spectra(f_spectrum, wave_numbers, spectra, max_bytes=MAX_BROADEN_BYTES, decimals=10,
+                  f_dados=None):
+    """
+    Write the spectra of an ensemble, a block of structures at a time.
+
+    Each block of about [max_bytes] is converted to text and written, so no
+    copy of the size of [spectra] is made (as spectra.tolist() or stacking
+    all the rows with the wavenumbers would).
+
+    Parameters
+    ----------
+    f_spectrum : file object
+        Text file of the spectra ("wavenumber   value" lines, a blank line
+        after each structure, as spectrum_gaussian.dat).
+    wave_numbers : array
+        Wavenumbers (nm) of the spectra.
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+    max_bytes : int
+        Memory (bytes) of the rows of each block.
+    decimals : int
+        Decimals of the values in [f_spectrum].
+    f_dados : file object
+        Also write the "wavenumber;value" lines of each structure
+        (dados_spectrum.txt), None does not.
+
+    Returns
+    -------
+    None.
+
+    """
+    labels = [f"{nm_valor:<4f}   " for nm_valor in wave_numbers]
+    block = max(1, int(max_bytes) // max(1, spectra.itemsize * len(labels)))
+    for first in range(0, len(spectra), block):
+        rows = spectra[first:first + block]
+        for spectrum in rows.tolist():
+            f_spectrum.write("".join(f"{label}{value:>6.{decimals}f}\n"
+                                     for label, value in zip(labels, spectrum)))
+            f_spectrum.write("\n")
+        if f_dados is not None:
+            np.savetxt(f_dados, np.column_stack((np.tile(wave_numbers, len(rows)), rows.ravel())),
+                       fmt="%6.10f", delimiter=";")
+
+
+def pairwise_sum(spectra, max_bytes=MAX_BROADEN_BYTES):
+    """
+    Sum of the spectra (rows) of an ensemble by pairwise summation, in their own type.
+
+    numpy.sum over the structures (axis 0 of a C array) adds one spectrum
+    after the other, with a rounding error that grows with the number of
+    structures; adding them by pairs (the first half with the second half,
+    log2(structures) passes over the array) keeps the error at about
+    log2(structures) * eps, which matters for the average in float32.
+
+    The pairs are added in a copy of a block of rows of about [max_bytes]
+    at a time, and the sums of the blocks again by pairs, so [spectra] is
+    not changed and the memory does not grow with the ensemble.
+
+    Parameters
+    ----------
+    spectra : numpy.ndarray
+        Spectrum of each structure (structures x wavenumbers).
+    max_bytes : int
+        Memory (bytes) of the copy of each block (MAX_BROADEN_BYTES).
+
+    Returns
+    -------
+    total : numpy.ndarray
+        Sum of the spectra at each wavenumber.
+
+    """
+    rows = len(spectra)
+    if rows == 0:
+        return np.zeros(spectra.shape[1:], dtype=spectra.dtype)
+
+    block_rows = max(2, int(max_bytes) // max(1, spectra[0].nbytes))
+    if rows > block_rows:
+        return pairwise_sum(np.stack([pairwise_sum(spectra[k:k + block_rows], max_bytes)
+                                      for k in range(0, rows, block_rows)]), max_bytes)
+
+    total = np.array(spectra, copy=True)
+    while rows > 1:
+        half = rows // 2
+        total[:half] += total[rows - half:rows]
+        rows -= half
+
+    # A copy, so the block is freed
+    return total[0].copy()
+
+
+def float32_deviation(counts, wavelengths, strengths, wave_numbers, spectra, average,
+                      max_bytes=MAX_BROADEN_BYTES, width=GAUSSIAN_WIDTH, threads=1):
+    """
+    Largest deviation of float32 gaussian spectra (and their average) from float64.
+
+    The float64 spectra are computed again (broaden_gaussian), a block of
+    structures at a time, so the comparison takes about [max_bytes] more
+    memory whatever the size of the ensemble.
+
+    Parameters
+    ----------
+    counts, wavelengths, strengths, wave_numbers :
+        See broaden_gaussian.
+    spectra : numpy.ndarray
+        float32 spectrum of each structure (structures x wavenumbers).
+    average : numpy.ndarray
+        float32 average spectrum.
+    max_bytes : int
+        Memory (bytes) of the float64 spectra of each block.
+    width : float
+        Width (1/e half width) of the gaussian (eV).
+    threads : int
+        Threads of broaden_gaussian.
+
+    Returns
+    -------
+    deviation : dict
+        Largest deviation of the spectra ("spectra") and of the average
+        ("average"), relative to the highest float64 value of each.
+
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = structure_offsets(counts)
+    n_grid = max(1, len(wave_numbers))
+    block = max(1, int(max_bytes) // (np.dtype(np.float64).itemsize * n_grid))
+
+    deviation = 0.0
+    highest = 0.0
+    total = np.zeros(len(wave_numbers))
+    for first in range(0, len(counts), block):
+        last = min(first + block, len(counts))
+        start, end = offsets[first], offsets[last]
+        exact = broaden_gaussian(counts[first:last], wavelengths[start:end], strengths[start:end],
+                                 wave_numbers, max_bytes, width, threads)
+        deviation = max(deviation, float(np.max(np.abs(exact - spectra[first:last]), initial=0.0)))
+        highest = max(highest, float(np.max(np.abs(exact), initial=0.0)))
+        total += exact.sum(axis=0)
+
+    exact = total / max(len(counts), 1)
+    tiny = np.finfo(np.float64).tiny
+
+    return {"spectra": deviation / max(highest, tiny),
+            "average": float(np.max(np.abs(exact - average), initial=0.0))
+            / max(float(np.max(np.abs(exact), initial=0.0)), tiny)}
+
+
+def fit_line_shape(name, type_of_average, wave_numbers, params=None, engine="direct",
+                   bins_per_width=FFT_BINS_PER_WIDTH, max_bytes=MAX_BROADEN_BYTES, threads=1):
+    """
+    Ajuste com uma forma de linha do registro (LINE_SHAPES).
+
+    Os espectros de todas as estruturas são calculados com broaden_line_shape,
+    no mesmo espaço (1/nm) da gaussiana, e salvos nos arquivos da forma de linha.
+
+    Parameters
+    ----------
+    name : str
+        Forma de linha (chave de LINE_SHAPES).
+    type_of_average : TYPE
+        DESCRIPTION.
+    wave_numbers : TYPE
+        DESCRIPTION.
+    params : dict
+        Parâmetros da forma de linha (line_shape_params).
+    engine : str
+        "direct" (cálculo de cada termo) ou "fft" (convolução em uma grade
+        uniforme).
+    bins_per_width : float
+        Pontos da grade uniforme por meia largura (engine "fft").
+    max_bytes : int
+        Memória (bytes) dos arrays temporários do cálculo dos espectros.
+    threads : int
+        Threads do cálculo direto (None, todas as CPUs disponíveis).
+
+    Returns
+    -------
+    None.
+
+    """
+    try:
+        _, counts, wavelengths, strengths = load_input()
+        m_valor = len(counts)
+        if m_valor == 0:
+            raise ValueError("nenhuma estrutura no arquivo de entrada")
+
+        if type_of_average == 'aritmética':
+            spectra = broaden_line_shape(name, counts, wavelengths, strengths, wave_numbers, params,
+                                         engine, bins_per_width, max_bytes, threads)
+        else:
+            spectra = np.zeros((m_valor, len(wave_numbers)))
+
+        spectrum_file, average_file = LINE_SHAPES[name]["files"]
+        decimals = LINE_SHAPES[name]["decimals"]
+        with open(spectrum_file, "w") as f_spectrum:
+            write_spectra(f_spectrum, wave_numbers, spectra, max_bytes, decimals)
+        print("")
+        print(f"Arquivo {spectrum_file} gerado!")
+
+        # Calculating and saving average
+        average = spectra.sum(axis=0)
+        if type_of_average == 'aritmética':
+            average = average / m_valor
+
+        with open(average_file, "w") as f_average:
+            for key, value in zip(wave_numbers, average.tolist()):
+                f_average.write(f"{key:<4f}   {value:>6.{decimals}f}\n")
+        print(f"Arquivo {average_file} gerado!")
+    except (KeyError, OSError, ValueError) as msg_err:
+        print(f'Erro ao ajustar como modelo {name}: {msg_err}')
+    except ZeroDivisionError as msg_err:
+        print(f"Divisão por zero: {msg_err}")
+
+
+def fit_lorentzian(type_of_average, wave_numbers, engine="direct",
+                   bins_per_width=FFT_BINS_PER_WIDTH, hwhm=LORENTZIAN_HWHM):
+    """
+    Ajuste lorentzian (fit_line_shape com a forma "lorentzian").
+
+    Parameters
+    ----------
+    type_of_average : TYPE
+        DESCRIPTION.
+    wave_numbers : TYPE
+        DESCRIPTION.
+    engine : str
+        "direct" ou "fft" (fit_line_shape).
+    bins_per_width : float
+        Pontos da grade uniforme por meia largura (engine "fft").
+    hwhm : float
+        Meia largura à meia altura da lorentziana (eV).
+
+    Returns
+    -------
+    None.
+
+    """
+    fit_line_shape("lorentzian", type_of_average, wave_numbers, {"hwhm": hwhm}, engine,
+                   bins_per_width)
+
+
+def spectrum_gaussian_structure(wavelengths, strengths, wave_numbers):
+    """
+    Gaussian spectrum of one structure, with the same formula of fit_gaussian.
+
+    Parameters
+    ----------
+    wavelengths : array
+        Wavelengths (nm) of the excited states.
+    strengths : array
+        Oscillator strengths of the excited states.
+    wave_numbers : array
+        Wavenumbers (nm) where the spectrum is calculated.
+
+    Returns
+    -------
+    spectrum : numpy.ndarray
+        Spectrum at each value of [wave_numbers].
+
+    """
+    return broaden_gaussian([len(wavelengths)], wavelengths, strengths, wave_numbers)[0]
+
+
+def write_spectrum_atomic(file_name, wave_numbers, spectrum):
+    """
+    Write a spectrum in a temporary file and replace [file_name] with it.
+
+    Who reads [file_name] (gnuplot, for example) never sees it half written.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file.
+    wave_numbers : array
+        Wavenumbers (nm).
+    spectrum : array
+        Values of the spectrum at each wavenumber.
+
+    Returns
+    -------
+    None.
+
+    """
+    local = os.path.dirname(os.path.abspath(file_name))
+    f_descriptor, tmp_name = tempfile.mkstemp(dir=local, prefix=".tmp_", suffix=".dat")
+    try:
+        with os.fdopen(f_descriptor, "w") as f_tmp:
+            for key, value in zip(wave_numbers, spectrum):
+                f_tmp.write(f"{key:<4f}   {value:>6.10f}\n")
+        os.replace(tmp_name, file_name)
+    except OSError:
+        os.remove(tmp_name)
+        raise
+
+
+def iter_terminated(results):
+    """
+    Skip the files without [Normal termination] (generator).
+
+    Parameters
+    ----------
+    results : iterable
+        Pairs (file, (wavelengths, strengths, founded)).
+
+    Yields
+    ------
+    local_log, wavelengths, strengths : tuple
+        Excited states of each file that ended normally.
+
+    """
+    for local_log, (wavelengths, strengths, founded) in results:
+        if not founded:
+            print(f" + Arquivo sem [Normal termination], ignorado: {local_log}")
+            continue
+        yield local_log, wavelengths, strengths
+
+
+def iter_spectra(states, wave_numbers, type_of_average='aritmética'):
+    """
+    Broaden the excited states of each structure into its gaussian spectrum (generator).
+
+    Parameters
+    ----------
+    states : iterable
+        Triples (file, wavelengths, strengths).
+    wave_numbers : array
+        Wavenumbers (nm) where the spectra are calculated.
+    type_of_average : str
+        Type of average (as in fit_gaussian, only 'aritmética' gives a spectrum).
+
+    Yields
+    ------
+    local_log, wavelengths, strengths, spectrum : tuple
+        Excited states and spectrum of each structure.
+
+    """
+    for local_log, wavelengths, strengths in states:
+        if type_of_average == 'aritmética':
+            spectrum = spectrum_gaussian_structure(wavelengths, strengths, wave_numbers)
+        else:
+            spectrum = np.zeros(len(wave_numbers))
+        yield local_log, wavelengths, strengths, spectrum
+
+
+def accumulate_spectra(spectra, wave_numbers, type_of_average='aritmética', text_input=False):
+    """
+    Add the spectra of an ensemble and write the files of fit_gaussian, structure after structure.
+
+    Each spectrum is written (spectrum_gaussian.dat and dados_spectrum.txt)
+    and added to the running sum as soon as it arrives, so the memory is
+    the size of the grid plus one structure, whatever the size of the
+    ensemble. The files written are the same of the extraction followed by
+    fit_gaussian: input.npz (and input.dat), spectrum_gaussian.dat,
+    average_spectrum.dat, dados_spectrum.txt and medias.txt.
+
+    Parameters
+    ----------
+    spectra : iterable
+        Quadruples (name of the file, wavelengths, strengths, spectrum), see
+        iter_spectra.
+    wave_numbers : array
+        Wavenumbers (nm) of the spectra.
+    type_of_average : str
+        Type of average.
+    text_input : bool
+        Also write the text file input.dat.
+
+    Returns
+    -------
+    m_valor : int
+        Number of structures in the average.
+
+    """
+    total = np.zeros(len(wave_numbers))
+    m_valor = 0
+    input_writer = InputWriter(text_input)
+
+    try:
+        with open("spectrum_gaussian.dat", "w") as f_spectrum_gaussian, \
+                open("dados_spectrum.txt", "w") as f_dados:
+            for local_log, wavelengths, strengths, spectrum in spectra:
+                print(f" - Extraindo estado excitado do arquivo: {local_log}")
+                input_writer.add(local_log, wavelengths, strengths)
+
+                write_spectra(f_spectrum_gaussian, wave_numbers, np.asarray(spectrum)[np.newaxis],
+                              f_dados=f_dados)
+
+                total += spectrum
+                m_valor += 1
+    finally:
+        input_writer.close()
+
+    print("")
+    print("Aquivo spectrum_gaussian.dat gerado!")
+
+    if m_valor == 0:
+        raise ValueError("nenhuma estrutura para calcular a média")
+
+    average = total / m_valor if type_of_average == 'aritmética' else total
+    with open("average_spectrum.dat", "w") as f_average:
+        for key, value in zip(wave_numbers, average):
+            f_average.write(f"{key:<4f}   {value:>6.10f}\n")
+    print("Arquivo average_spectrum.dat gerado!")
+
+    np.savetxt("medias.txt", np.column_stack((wave_numbers, average)), fmt="%6.10f",
+               delimiter=";")
+
+    return m_valor
+
+
+def stream_data_gaussian(type_of_average, wave_numbers, workers=None, use_cache=True,
+                         use_hash=False, text_input=False, discovery=None):
+    """
+    Extrai os estados excitados e calcula o espectro médio em uma única passagem.
+
+    Cada arquivo é lido, alargado (gaussiana) e somado à média, e sua memória
+    liberada em seguida (parse → broaden → accumulate), de modo que o consumo
+    de memória não cresce com o número de arquivos.
+
+    Parameters
+    ----------
+    type_of_average : str
+        Tipo de média.
+    wave_numbers : array
+        Números de onda (nm) onde os espectros são calculados.
+    workers, use_cache, use_hash, text_input, discovery :
+        Ver extract_data_gaussian.
+
+    Returns
+    -------
+    None.
+
+    """
+    try:
+        local_files = input("Local dos arquivos".ljust(57, ".") + ": ").strip()
+        if local_files == "":
+            print(" + Caminho não informado. Saindo!")
+            sys.exit()
+
+        if not file_exist(local_files):
+            print(" + Caminho não existe. Saindo!")
+            sys.exit()
+
+        wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+        start = time.perf_counter()
+        if is_archive(local_files):
+            # Membros do arquivo tar ou zip, lidos em sequência
+            results = ((name, parse_gaussian_stream(f_log))
+                       for name, f_log in iter_archive(local_files, '.log'))
+            cache = None
+        else:
+            all_logs = get_files(local_files, '.log', **(discovery or {}))
+            cache = open_cache(local_files, use_hash) if use_cache else None
+            results = ((os.path.relpath(local_log, local_files), result)
+                       for local_log, result in
+                       iter_excited_states([os.path.join(local_files, log) for log in all_logs],
+                                           parse_gaussian, workers, cache))
+        try:
+            m_valor = accumulate_spectra(iter_spectra(iter_terminated(results), wave_numbers,
+                                                      type_of_average),
+                                         wave_numbers, type_of_average, text_input)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        print(f" - {m_valor} estruturas em {time.perf_counter() - start:.2f} s")
+    except (OSError, ValueError) as msg_err:
+        print(f" + Erro: {msg_err}")
+
+
+def watch_directory(local, wave_numbers, interval=30.0, use_cache=True, cycles=None,
+                    discovery=None):
+    """
+    Watch a directory and update the average spectrum as the Gaussian jobs finish.
+
+    The directory is polled every [interval] seconds. Each log that reaches
+    [Normal termination] is read, its gaussian spectrum is appended to
+    spectrum_gaussian.dat and added to the running sum, and the file
+    average_spectrum.dat is rewritten (atomically). A new log costs the size
+    of the grid, not the size of the ensemble.
+
+    A log without [Normal termination] (still running, or finished with an
+    error) is verified again only after it changes (size or modification
+    time). A log that can not be read (LOG_READ_ERRORS: removed, or a
+    compressed file still being written) is skipped and tried again in the
+    next verification.
+
+    Parameters
+    ----------
+    local : str
+        Directory of the log files.
+    wave_numbers : array
+        Wavenumbers (nm) where the spectra are calculated.
+    interval : float
+        Seconds between two verifications of the directory.
+    use_cache : bool
+        Keep the extracted data in a cache (ParseCache) in the directory.
+    cycles : int
+        Number of verifications (None, until the program is interrupted).
+    discovery : dict
+        Options of the search of the files (recursive, include, exclude and
+        walkers of get_files).
+
+    Returns
+    -------
+    m_valor : int
+        Number of structures in the average.
+
+    """
+    wave_numbers = np.asarray(wave_numbers, dtype=np.float64)
+    total = np.zeros_like(wave_numbers)
+    m_valor = 0
+    done = set()
+    # Size and modification time of the logs found without [Normal termination]
+    pending = {}
+
+    # Spectra of each structure are appended to this file
+    open("spectrum_gaussian.dat", "w").close()
+
+    print(f" - Watching {local} (every {interval} s, Ctrl+C to stop)")
+    cycle = 0
+    try:
+        while cycles is None or cycle < cycles:
+            cycle += 1
+            new_logs = []
+            try:
+                list_log = get_files(local, '.log', **(discovery or {}))
+            except OSError as msg_err:
+                print(f" + {local} not listed ({msg_err}), trying again later")
+                list_log = []
+            for log in list_log:
+                local_log = os.path.join(local, log)
+                if local_log in done:
+                    continue
+                try:
+                    stat = os.stat(local_log)
+                    version = (stat.st_size, stat.st_mtime_ns)
+                    if pending.get(local_log) == version:
+                        continue
+                    if normal_termination(local_log):
+                        new_logs.append(local_log)
+                    else:
+                        pending[local_log] = version
+                except LOG_READ_ERRORS as msg_err:
+                    print(f" + {log} not verified ({msg_err}), trying again later")
+
+            added = 0
+            if new_logs:
+                cache = open_cache(local) if use_cache else None
+                results = []
+                for local_log in new_logs:
+                    try:
+                        results.append((local_log, extract_excited_states([local_log],
+                                                                          parse_gaussian, 1,
+                                                                          cache)[0]))
+                    except LOG_READ_ERRORS as msg_err:
+                        print(f" + {os.path.basename(local_log)} not read ({msg_err}), "
+                              "trying again later")
+                if cache is not None:
+                    cache.close()
+
+                with open("spectrum_gaussian.dat", "a") as f_spectrum_gaussian:
+                    for local_log, (wavelengths, strengths, _) in results:
+                        spectrum = spectrum_gaussian_structure(wavelengths, strengths, wave_numbers)
+                        for nm_valor, value in zip(wave_numbers, spectrum):
+                            f_spectrum_gaussian.write(f"{nm_valor:<4f}   {value:>6.10f}\n")
+                        f_spectrum_gaussian.write("\n")
+
+                        total += spectrum
+                        m_valor += 1
+                        added += 1
+                        done.add(local_log)
+                        pending.pop(local_log, None)
+                        print(f" - Added to the average: {os.path.basename(local_log)}")
+
+            if added:
+                write_spectrum_atomic("average_spectrum.dat", wave_numbers, total / m_valor)
+                print(f" - average_spectrum.dat updated ({m_valor} structures)")
+
+            if cycles is None or cycle < cycles:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print("")
+
+    return m_valor
+
+
+def main(type_of_fit, type_of_average, wave_numbers, wave_numbers_interval,
+         max_bytes=MAX_BROADEN_BYTES, cutoff=None, engine="direct",
+         bins_per_width=FFT_BINS_PER_WIDTH, params=None, threads=1, precision="float64",
+         mode="exp"):
+    """
+    Função principal.
+
+    Parameters
+    ----------
+    type_of_fit : TYPE
+        tipo de ajuste.
+    type_of_average : TYPE
+        tipo de media a ser calculada.
+    wave_numbers : TYPE
+        faixa de números de onda.
+    wave_numbers_interval : TYPE
+        intervalo para a faixa de número de onda.
+    max_bytes : int
+        memória (bytes) dos arrays temporários do ajuste gaussian.
+    cutoff : float
+        larguras da janela de cada transição no ajuste gaussian (None, sem janela).
+    engine : str
+        cálculo dos espectros, "direct" ou "fft" (BROADENING_ENGINES).
+    bins_per_width : float
+        pontos da grade uniforme por largura da linha (engine "fft").
+    params : dict
+        parâmetros da forma de linha (LINE_SHAPES), os demais com o valor padrão.
+    threads : int
+        threads do cálculo direto dos espectros (None, todas as CPUs disponíveis).
+    precision : str
+        precisão do cálculo direto e da média do ajuste gaussian (PRECISIONS).
+    mode : str
+        cálculo dos termos da gaussiana, "exp" ou "table" (GAUSSIAN_MODES).
+
+    Returns
+    -------
+    None.
+
+    """
+    type_of_fit, type_of_average, wave_numbers, wave_numbers_interval = questions(type_of_fit,
+                                                                                  type_of_average, wave_numbers,
+                                                                                  wave_numbers_interval)
+
+    params = params or {}
+    for param in params:
+        if param not in LINE_SHAPES[type_of_fit]["params"]:
+            print(f" + Parâmetro ({param}) não usado pelo ajuste ({type_of_fit})")
+    try:
+        params = line_shape_params(type_of_fit, params)
+    except ValueError as msg_err:
+        print(f"Erro: {msg_err}")
+        return
+    if type_of_fit != "gaussian":
+        ignored = [name for name, used in (("--cutoff", cutoff is not None),
+                                           ("--precision", precision != "float64"),
+                                           ("--table", mode != "exp")) if used]
+        if ignored:
+            print(f" + {', '.join(ignored)} só no ajuste gaussian, ignorado(s) no ({type_of_fit})")
+    print(f" - Ajuste {type_of_fit}: " + ", ".join(
+        f"{param}={value:g} {LINE_SHAPES[type_of_fit]['params'][param]['unit']}".rstrip()
+        for param, value in params.items()))
+
+    # The gaussian also writes the data of the standard error and has the window (cutoff)
+    if type_of_fit == "gaussian":
+        fit_gaussian(type_of_average, wave_numbers, max_bytes, cutoff, engine, bins_per_width,
+                     threads=threads, precision=precision, mode=mode, **params)
+    else:
+        fit_line_shape(type_of_fit, type_of_average, wave_numbers, params, engine, bins_per_width,
+                       max_bytes, threads)
 
 
 if __name__ == "__main__":
@@ -651,10 +4310,141 @@ if __name__ == "__main__":
     wave_numbers_interval = 10
     wave_numbers = list(np.arange(100, 801, wave_numbers_interval))
 
+    parser = argparse.ArgumentParser(description="UV-VIS chart for excited states calculations.")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of processes used to extract the data (default: all the available CPUs)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"read all the files again, without the cache ({CACHE_FILE})")
+    parser.add_argument("--hash", action="store_true",
+                        help="also compare the content of the files with the cache (SHA-1)")
+    parser.add_argument("--orca-spectrum", choices=ORCA_REPRESENTATIONS, default="electric",
+                        help="absorption table read from the Orca outputs (default: electric)")
+    parser.add_argument("--text-input", action="store_true",
+                        help=f"also write the extracted data in the text format ({INPUT_DAT})")
+    parser.add_argument("--export-dat", action="store_true",
+                        help=f"write {INPUT_DAT} from {INPUT_NPZ} and exit")
+    parser.add_argument("--watch", metavar="DIR", default=None,
+                        help="watch DIR and update average_spectrum.dat as the Gaussian jobs finish")
+    parser.add_argument("--interval", type=float, default=30.0,
+                        help="seconds between two verifications of the watched directory (default: 30)")
+    parser.add_argument("--waves", default="100-800",
+                        help="wavenumbers used in the watch mode (default: 100-800)")
+    parser.add_argument("--step", type=float, default=wave_numbers_interval,
+                        help=f"interval between waves in the watch mode (default: {wave_numbers_interval})")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="also search the output files in the subdirectories")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="only read the files whose relative path matches GLOB (repeatable)")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="skip the files and directories matching GLOB (repeatable)")
+    parser.add_argument("--walkers", type=int, default=4,
+                        help="number of directories listed at the same time (default: 4)")
+    parser.add_argument("--stream", action="store_true",
+                        help="extract the Gaussian logs and compute the gaussian spectra in a single "
+                             "pass, with memory independent of the number of files")
+    parser.add_argument("--max-memory", type=float, default=MAX_BROADEN_BYTES / 2**20, metavar="MB",
+                        help="memory of the temporary arrays of the gaussian fit "
+                             f"(default: {MAX_BROADEN_BYTES // 2**20} MB)")
+    parser.add_argument("--cutoff", type=float, default=None, metavar="K",
+                        help="evaluate each transition of the gaussian fit only within K widths "
+                             "of its peak (relative error below exp(-K**2))")
+    parser.add_argument("--engine", choices=BROADENING_ENGINES, default="direct",
+                        help="evaluate every term (direct) or convolve on a uniform grid (fft)")
+    parser.add_argument("--fft-bins", type=float, default=FFT_BINS_PER_WIDTH, metavar="N",
+                        help=f"bins per line width in the fft engine (default: {FFT_BINS_PER_WIDTH})")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time the vectorized gaussian against the scalar loops, on the "
+                             "extracted data and the --waves/--step grid, and exit")
+    parser.add_argument("--fft-report", action="store_true",
+                        help="compare the fft engine with the direct evaluation for several "
+                             "bin widths, on the extracted data and the --waves/--step grid, and exit")
+    parser.add_argument("--hwhm", type=float, default=None, metavar="EV",
+                        help="half width at half maximum of the lorentzian, voigt and pseudo_voigt "
+                             f"fits, in eV (default: {LORENTZIAN_HWHM})")
+    parser.add_argument("--backend", choices=["auto"] + list(GAUSSIAN_BACKENDS), default=None,
+                        help="backend of the gaussian broadening (default: the fastest one, measured "
+                             f"once per machine; also set by the environment variable {BACKEND_ENV})")
+    parser.add_argument("--threads", type=int, default=1, metavar="N",
+                        help="threads of the direct broadening, over tiles of structures x "
+                             f"wavenumbers (0: all the available CPUs, {available_cpus()} here)")
+    parser.add_argument("--precision", choices=PRECISIONS, default="float64",
+                        help="precision of the direct gaussian broadening and of its average; "
+                             "float32 uses half the memory and reports its deviation from float64")
+    parser.add_argument("--table", action="store_true",
+                        help="evaluate the direct gaussian by linear interpolation in a table of "
+                             f"exp(-x**2) (relative error below {table_error_bound():.1e})")
+    parser.add_argument("--param", action="append", metavar="NAME=VALUE",
+                        help="parameter of the line shape of the fit, for example width=0.3 or "
+                             "eta=0.7 (repeatable; see LINE_SHAPES)")
+    args = parser.parse_args()
+    params = {}
+    for item in args.param or []:
+        name, _, value = item.partition("=")
+        try:
+            params[name.strip()] = float(value)
+        except ValueError:
+            parser.error(f"invalid line shape parameter ({item})")
+    if args.hwhm is not None:
+        params["hwhm"] = args.hwhm
+    # The fft engine and the window (--cutoff) do not use the options of the direct engine
+    if args.cutoff is not None and args.engine == "fft":
+        parser.error("--cutoff is a window of the direct engine, not used with --engine fft")
+    direct_options = [name for name, used in (("--table", args.table),
+                                              ("--threads", args.threads != 1),
+                                              ("--precision", args.precision != "float64"),
+                                              ("--backend", args.backend is not None)) if used]
+    if args.engine == "fft" and direct_options:
+        parser.error(f"{', '.join(direct_options)} not used with --engine fft")
+    if args.cutoff is not None and args.backend is not None:
+        parser.error("--backend not used with --cutoff")
+    if args.backend is not None:
+        select_backend(args.backend)
+    threads = args.threads if args.threads > 0 else None
+    mode = "table" if args.table else "exp"
+    max_bytes = int(args.max_memory * 2**20)
+    discovery = {"recursive": args.recursive, "include": args.include,
+                 "exclude": args.exclude, "walkers": args.walkers}
+
     head_msg()
 
-    if file_exist("input.dat"):
-        main(type_of_fit, type_of_average, wave_numbers, wave_numbers_interval)
+    if args.watch is not None:
+        values = [int(i) for i in args.waves.split("-")]
+        watch_directory(args.watch, np.arange(values[0], values[1]+1, args.step),
+                        args.interval, not args.no_cache, discovery=discovery)
+        tchau()
+
+    if args.stream:
+        type_of_fit, type_of_average, wave_numbers, _ = questions(type_of_fit, type_of_average,
+                                                                  wave_numbers,
+                                                                  wave_numbers_interval)
+        if type_of_fit != "gaussian":
+            print(f" + Ajuste ({type_of_fit}) não disponível com --stream, usando (gaussian)")
+        stream_data_gaussian(type_of_average, wave_numbers, args.workers, not args.no_cache,
+                             args.hash, args.text_input, discovery)
+        tchau()
+
+    if args.benchmark:
+        values = [int(i) for i in args.waves.split("-")]
+        _, counts, wavelengths, strengths = load_input()
+        benchmark_broadening(counts, wavelengths, strengths,
+                             np.arange(values[0], values[1]+1, args.step))
+        tchau()
+
+    if args.fft_report:
+        values = [int(i) for i in args.waves.split("-")]
+        _, counts, wavelengths, strengths = load_input()
+        fft_accuracy(counts, wavelengths, strengths, np.arange(values[0], values[1]+1, args.step))
+        tchau()
+
+    if args.export_dat:
+        export_input_dat(INPUT_DAT, *load_input_npz(INPUT_NPZ))
+        stamp_input_dat()
+        print(f" - {INPUT_DAT} gerado a partir de {INPUT_NPZ}")
+        tchau()
+
+    if file_exist(INPUT_NPZ) or file_exist(INPUT_DAT):
+        main(type_of_fit, type_of_average, wave_numbers, wave_numbers_interval, max_bytes,
+             args.cutoff, args.engine, args.fft_bins, params, threads, args.precision, mode)
     else:
         val = "S"
         val = input("O input.dat não existe. Deseja gerá-lo? "
@@ -674,14 +4464,18 @@ if __name__ == "__main__":
                     type_of_app = val
 
                 if type_of_app == "Gaussian":
-                    extract_data_gaussian()
+                    extract_data_gaussian(args.workers, not args.no_cache, args.hash, args.text_input,
+                                          discovery)
                     main(type_of_fit, type_of_average, wave_numbers,
-                         wave_numbers_interval)
+                         wave_numbers_interval, max_bytes, args.cutoff, args.engine,
+                         args.fft_bins, params, threads, args.precision, mode)
                 else:
                     if type_of_app == "Orca":
-                        extract_data_orca()
+                        extract_data_orca(args.workers, not args.no_cache, args.hash, args.text_input,
+                                          args.orca_spectrum, discovery)
                         main(type_of_fit, type_of_average, wave_numbers,
-                             wave_numbers_interval)
+                             wave_numbers_interval, max_bytes, args.cutoff, args.engine,
+                             args.fft_bins, params, threads, args.precision, mode)
                     else:
                         print(f' + Valor ({val}) inválido!')
         else:
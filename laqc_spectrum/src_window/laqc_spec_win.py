@@ -17,7 +17,6 @@ try:
     from pathlib import Path
     import os
     import platform
-    import math
     import numpy as np
     import matplotlib
     matplotlib.use('Qt5Agg')
@@ -28,19 +27,21 @@ try:
     # Classes use in this project
     import classMessageBox
     import classTabOptionsGraph
+
+    # Extraction and fit functions shared with the command line version (../src)
+    sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+    import laqc_spectrum
 except ImportError as e:
     print('[!] The required Python libraries could not be imported:', file=sys.stderr)
     print(f'\t{e}')
     sys.exit(1)
 
 # Constants
-A = 1.30629744736E8
-FACT1 = 1.0E7
-FACT2 = 1.0E0
-SIGMA = 3099.6
 MSG_TITLE = "LaQC Spectrum"
 
-typeFit = ['Gaussian', 'Lorentzian']
+# Line shapes of the fit (registry of laqc_spectrum) and their names in the combo
+lineShapes = list(laqc_spectrum.LINE_SHAPES)
+typeFit = [laqc_spectrum.LINE_SHAPES[name]["label"] for name in lineShapes]
 
 
 class mplCustomizedToolbar(NavigationToolbar):
@@ -179,7 +180,7 @@ class MainWindow(QtWidgets.QMainWindow):
         openFile = QtWidgets.QFileDialog()
         openFile.setDirectory(os.getcwd())
         openFile.setFileMode(QtWidgets.QFileDialog.ExistingFiles)
-        openFile.setNameFilter("Log (*.log)")
+        openFile.setNameFilter("Log (*.log *.log.gz *.log.xz *.log.bz2 *.log.zst)")
         openFile.setViewMode(QtWidgets.QFileDialog.ViewMode.List)
         if openFile.exec():
             self.selectedFileName = openFile.selectedFiles()
@@ -402,6 +403,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.edtInterval = QtWidgets.QLineEdit()
         self.edtInterval.setText("0.5")
         self.edtInterval.setInputMask("9.00")
+        # Parameters of the selected line shape (one field per parameter)
+        self.paramsWid = QtWidgets.QWidget()
+        self.paramsLay = QtWidgets.QFormLayout()
+        self.paramsLay.setContentsMargins(0, 0, 0, 0)
+        self.paramsWid.setLayout(self.paramsLay)
+        self.edtParams = {}
+        self.populate_params()
+        self.combTypeFit.currentIndexChanged.connect(self.populate_params)
         self.optUVVisGrid.addWidget(self.lblTypeFit, 0, 0, 1, 1)
         self.optUVVisGrid.addWidget(self.combTypeFit, 0, 1, 1, 2)
         self.optUVVisGrid.addWidget(self.lblWaveNumb, 1, 0, 1, 3)
@@ -410,6 +419,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.optUVVisGrid.addWidget(self.lblTo, 2, 1)
         self.optUVVisGrid.addWidget(self.edtWaveTo, 2, 2)
         self.optUVVisGrid.addWidget(self.edtInterval, 2, 3)
+        self.optUVVisGrid.addWidget(self.paramsWid, 3, 0, 1, 4)
 
         # UV-Vis Options and Type of Average -> Type of Average
         self.groupAverage = QtWidgets.QGroupBox("Type of average")
@@ -452,6 +462,35 @@ class MainWindow(QtWidgets.QMainWindow):
         # Adding layout to frame
         self.leftFrame.setLayout(self.boxLeftLayout)
 
+    def populate_params(self, index=None):
+        """Fields of the parameters of the selected line shape, with their default values."""
+        while self.paramsLay.rowCount() > 0:
+            self.paramsLay.removeRow(0)
+
+        self.edtParams = {}
+        name = lineShapes[self.combTypeFit.currentIndex()]
+        for param, spec in laqc_spectrum.LINE_SHAPES[name]["params"].items():
+            edtParam = QtWidgets.QLineEdit()
+            edtParam.setText(str(spec["default"]))
+            edtParam.setStatusTip(spec["help"].capitalize())
+            self.paramsLay.addRow(f"{param} ({spec['unit']})" if spec["unit"] else param, edtParam)
+            self.edtParams[param] = edtParam
+
+    def line_shape_params(self):
+        """
+        Line shape selected and the values of its parameters.
+
+        Returns
+        -------
+        name, params : tuple
+            Name of the line shape (key of laqc_spectrum.LINE_SHAPES) and the
+            parameters validated by laqc_spectrum.line_shape_params.
+        """
+        name = lineShapes[self.combTypeFit.currentIndex()]
+        params = {param: float(edtParam.text().strip()) for param, edtParam in self.edtParams.items()}
+
+        return name, laqc_spectrum.line_shape_params(name, params)
+
     def verify_waves(self):
         """
         Verify if values of waves and interval are valid.
@@ -467,6 +506,7 @@ class MainWindow(QtWidgets.QMainWindow):
             wave_from = int(self.edtWaveFrom.text().strip())
             wave_to = int(self.edtWaveTo.text().strip())
             interval = float(self.edtInterval.text().strip())
+            self.line_shape_params()
             if wave_to <= wave_from:
                 validation = False
             if interval <= 0.0:
@@ -483,8 +523,9 @@ class MainWindow(QtWidgets.QMainWindow):
                 # List of select files
                 log_files = [i.text() for i in self.listFiles.selectedItems()]
 
-                # Extract data from gaussian (make input.dat)
-                self.extract_data_gaussian(log_files)
+                # Extract data from gaussian (make input.npz)
+                if not self.extract_data_gaussian(log_files):
+                    return
 
                 # Wave and interval waves
                 wave_numbers_interval = float(self.edtInterval.text())
@@ -498,8 +539,10 @@ class MainWindow(QtWidgets.QMainWindow):
                     if radioButton.isChecked():
                         type_of_average = radioButton.text()
 
-                # Fit gaussian
-                dataX, dataY, dataLegends = self.fit_gaussian(type_of_average, wave_numbers)
+                # Fit (line shape selected)
+                name, params = self.line_shape_params()
+                dataX, dataY, dataLegends = self.fit_line_shape(name, type_of_average, wave_numbers,
+                                                                params)
                 self.listLegends = [dataLegends[i] for i in dataLegends]
                 self.dataLegends = dataLegends
                 self.dataX = dataX
@@ -532,7 +575,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
                 self.btnUpdate.setEnabled(True)
             else:
-                self.msgbox.showError(MSG_TITLE, "Verify values of waves and interval.")
+                self.msgbox.showError(MSG_TITLE, "Verify values of waves, interval and line shape parameters.")
         else:
             self.msgbox.showInfo(MSG_TITLE, "Select some file to be calculated.")
 
@@ -767,162 +810,161 @@ class MainWindow(QtWidgets.QMainWindow):
         infoMessage.setIcon(1)
         infoMessage.exec_()
 
-    def fit_gaussian(self, type_of_average, wave_numbers):
+    def fit_line_shape(self, name, type_of_average, wave_numbers, params):
         """
-        Ajuste gaussian.
+        Ajuste com uma forma de linha do registro (laqc_spectrum.LINE_SHAPES).
 
         Parameters
         ----------
-        type_of_average : TYPE
-            DESCRIPTION.
-        wave_numbers : TYPE
-            DESCRIPTION.
+        name : str
+            Line shape (key of laqc_spectrum.LINE_SHAPES).
+        type_of_average : str
+            Type of average.
+        wave_numbers : list
+            Wavenumbers (nm) where the spectra are calculated.
+        params : dict
+            Parameters of the line shape.
 
         Returns
         -------
-        None.
+        dataX, dataY, dataLegend : tuple
+            See save_spectra.
+
+        """
+        try:
+            files_name, counts, wavelengths, strengths = laqc_spectrum.load_input_npz("input.npz")
+
+            # Spectra of all the structures at once (structures x wavenumbers), with
+            # tiles of structures x wavenumbers on threads of all the CPUs available;
+            # with Numba the gaussian interpolates its terms in a table of exp(-x**2)
+            if type_of_average == 'Arithmetic':
+                mode = laqc_spectrum.fast_gaussian_mode()
+                spectra = laqc_spectrum.broaden_line_shape(name, counts, wavelengths, strengths,
+                                                           wave_numbers, params, threads=None,
+                                                           mode=mode)
+                if mode == "table" and "broaden" in laqc_spectrum.LINE_SHAPES[name]:
+                    self.statusBar.showMessage(f" - Gaussiana tabelada: erro relativo máximo "
+                                               f"{laqc_spectrum.table_error_bound():.1e}")
+            else:
+                spectra = np.zeros((len(counts), len(wave_numbers)))
+
+            spectrum_file, average_file = laqc_spectrum.LINE_SHAPES[name]["files"]
+            return self.save_spectra(files_name, spectra, type_of_average, wave_numbers,
+                                     spectrum_file, average_file,
+                                     laqc_spectrum.LINE_SHAPES[name]["decimals"])
+        except (OSError, ValueError) as msg_err:
+            print(f'Erro ao ajustar como modelo {name}: {msg_err}')
+        except ZeroDivisionError as msg_err:
+            print(f"Divisão por zero: {msg_err}")
+
+    def save_spectra(self, files_name, spectra, type_of_average, wave_numbers,
+                     spectrum_file, average_file, decimals):
+        """
+        Save the spectra of the structures and their average.
+
+        Parameters
+        ----------
+        files_name : list
+            Name of the file of each structure.
+        spectra : numpy.ndarray
+            Spectrum of each structure (structures x wavenumbers).
+        type_of_average : str
+            Type of average.
+        wave_numbers : list
+            Wavenumbers (nm) of the spectra.
+        spectrum_file : str
+            File of the spectra of the structures.
+        average_file : str
+            File of the average spectrum.
+        decimals : int
+            Decimal places of the values in the files.
+
+        Returns
+        -------
+        dataX, dataY, dataLegend : tuple
+            Wavenumbers and values of each spectrum (to be plotted), and the
+            legend of each structure.
 
         """
-        average = {}
-        dataX = []
-        dataY = []
         dataLegend = {}
+        m_valor = len(spectra)
 
-        try:
-            f_spectrum_gaussian = open("spectrum_gaussian.dat", "w")
-
-            with open("input.dat", "r") as f_input:
-                m_valor = int(f_input.readline())
-                n_valor = [int(i) for i in f_input.readline().split(" ")]
-                files_name = [i for i in f_input.readline().split(" ")]
-
-                maxn = max(n_valor)
-                eigenvalue = [[0.0]*maxn for i in np.arange(0, m_valor)]
-                strength = [[0.0]*maxn for i in np.arange(0, m_valor)]
-
-                for j in range(0, m_valor):
-                    for i in range(0, n_valor[j]):
-                        read_line = f_input.readline()
-                        if (read_line.strip()) != "":
-                            values = [float(i) for i in read_line.split("  ")]
-                            eigenvalue[j][i] = values[0]
-                            strength[j][i] = values[1]
-            f_input.close()
+        dataX = [list(wave_numbers) for _ in range(0, m_valor)]
+        dataY = spectra.tolist()
 
+        with open(spectrum_file, "w") as f_spectrum:
             for j in range(0, m_valor):
-                valorX = []
-                valorY = []
-
-                for nm_valor in wave_numbers:
-                    spectrum = 0.0
-                    for i in range(0, n_valor[j]):
-                        if type_of_average == 'Arithmetic':
-                            spectrum = spectrum + A * \
-                                (strength[j][i] / (FACT1/SIGMA)) * math.exp(-(((1.0/nm_valor) -
-                                                                               (1.0/eigenvalue[j][i]))/(FACT2/SIGMA))**2)
-
-                    f_spectrum_gaussian.write(f"{nm_valor:<4f}   {spectrum:>6.10f}\n")
-                    valorX.append(nm_valor)
-                    valorY.append(spectrum)
-
-                    if nm_valor in average:
-                        average[nm_valor] = average[nm_valor] + spectrum
-                    else:
-                        average[nm_valor] = spectrum
-
-                f_spectrum_gaussian.write("\n")
-                dataX.append(valorX)
-                dataY.append(valorY)
+                f_spectrum.write("".join(f"{nm_valor:<4f}   {spectrum:>6.{decimals}f}\n"
+                                         for nm_valor, spectrum in zip(wave_numbers, dataY[j])))
+                f_spectrum.write("\n")
 
                 # Get the name of a log file was just calculated
                 dataLegend[self.get_name_file(files_name[j])] = self.get_name_file(files_name[j])
 
-            f_spectrum_gaussian.close()
+        # Calculating and saving average
+        average = spectra.sum(axis=0)
+        if type_of_average == 'Arithmetic':
+            average = average / m_valor
 
-            # Calculating and saving average
-            if type_of_average == 'Arithmetic':
-                for key in average.keys():
-                    average[key] = average[key] / m_valor
-
-            with open("average_spectrum.dat", "w") as f_average:
-                for key, value in average.items():
-                    f_average.write(f"{key:<4f}   {value:>6.10f}\n")
-            f_average.close()
-            # print("Arquivo average_spectrum.dat gerado!")
-
-            return dataX, dataY, dataLegend
-        except OSError as msg_err:
-            print(f"Erro: {msg_err}")
-        except ZeroDivisionError:
-            print(f"Divisão por zero: {A} * ({strength[j][i]} / "
-                  "({fact1}/{sigma})) * math.exp(-(((1.0/{nm})-"
-                  "(1.0/{eigenvalue[j][i]}))/({fact2}/{sigma}))**2)")
+        with open(average_file, "w") as f_average:
+            for key, value in zip(wave_numbers, average.tolist()):
+                f_average.write(f"{key:<4f}   {value:>6.{decimals}f}\n")
+
+        return dataX, dataY, dataLegend
 
     def extract_data_gaussian(self, list_log):
         """
         Extraindo dados de estados excitados no arquivo de saída do Gaussian.
 
+        Como no script, os arquivos sem [Normal termination] são ignorados.
+
+        Parameters
+        ----------
+        list_log : list
+            Arquivos selecionados (com o caminho).
+
         Returns
         -------
-        None.
+        extracted : bool
+            True se input.npz foi gravado com alguma estrutura.
 
         """
-        excited_states = []
+        list_files = []
+        list_wavelengths = []
+        list_strengths = []
         list_num_excited_state = []
         try:
-            # Extracting data
-            for log in list_log:
-
-                self.statusBar.showMessage(f" - Extraindo estado excitado do arquivo: {log}")
-
-                # if normal_termination(local_log):
-                num_excited_state = 0
-                with open(log, "r") as f_arquivo:
-
-                    secao_encontrada = False
-
-                    for line in f_arquivo:
-                        txt_linha = line.strip()
-
-                        if txt_linha.startswith("(Enter /scr/programs/g09/l914.exe)"):
-                            secao_encontrada = True
-                        else:
-                            if txt_linha.startswith("Leave Link") and secao_encontrada:
-                                break
-
-                        if secao_encontrada:
-                            if txt_linha.startswith("Excited State"):
-                                num_excited_state = num_excited_state + 1
-
-                                # restante da linha
-                                restante = txt_linha.split(":")[1]
-
-                                resto = []
-                                for i in restante.split(" "):
-                                    if i != "":
-                                        resto.append(i)
-                                comprimento_onda = resto[3]
-                                forca_oscilador = resto[5].replace("f=", "")
-                                excited_states.append([comprimento_onda, forca_oscilador])
-
-                    list_num_excited_state.append(num_excited_state)
-                    f_arquivo.close()
-
-            # Saving data
-            f_input = open("input.dat", "w")
-            f_input.write(f"{len(list_log):<4d}\n")
-            f_input.write(f'{" ".join(str(i) for i in list_num_excited_state)}\n')
-
-            # Name for files log
-            f_input.write(f'{" ".join(i for i in list_log)}\n')
-
-            for item in excited_states:
-                f_input.write(f'{"  ".join(str(i) for i in item)}\n')
-            f_input.close()
-            self.statusBar.showMessage("")
-        except OSError as msg_err:
-            self.msgbox.showError(MSG_TITLE, msg_err)
-            # print(f" + Erro: {msg_err}")
+            # Extracting data (in parallel processes)
+            self.statusBar.showMessage(f" - Extraindo estados excitados de {len(list_log)} arquivo(s)")
+            # Only new or changed files are read again (cache next to the data)
+            cache = laqc_spectrum.open_cache(os.path.dirname(list_log[0]))
+            results = laqc_spectrum.extract_excited_states(list_log, cache=cache)
+            if cache is not None:
+                cache.close()
+            for local_log, (wavelengths, strengths, terminated) in zip(list_log, results):
+                if not terminated:
+                    continue
+                list_files.append(local_log)
+                list_wavelengths.append(wavelengths)
+                list_strengths.append(strengths)
+                list_num_excited_state.append(len(wavelengths))
+
+            ignored = len(list_log) - len(list_files)
+            if not list_files:
+                self.statusBar.showMessage(f" + Nenhum arquivo com [Normal termination] "
+                                           f"({ignored} ignorado(s))")
+                return False
+
+            # Saving data (binary format, with the names of the files)
+            laqc_spectrum.save_input_npz("input.npz", list_files, list_num_excited_state,
+                                         np.concatenate(list_wavelengths),
+                                         np.concatenate(list_strengths))
+            self.statusBar.showMessage(f" + {ignored} arquivo(s) sem [Normal termination] ignorado(s)"
+                                       if ignored else "")
+            return True
+        except (OSError, ValueError) as msg_err:
+            self.msgbox.showError(MSG_TITLE, str(msg_err))
+            return False
 
 
 def main(exist_style=True):
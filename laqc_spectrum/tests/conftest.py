@@ -0,0 +1,21 @@
+"""Configuração dos testes: laqc_spectrum é importado de ../src."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import laqc_spectrum  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path_factory, monkeypatch):
+    """Home temporário: a escolha do backend (BACKEND_FILE) não é gravada no home real."""
+    home = tmp_path_factory.mktemp("home")
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("USERPROFILE", str(home))
+    monkeypatch.delenv(laqc_spectrum.BACKEND_ENV, raising=False)
+    monkeypatch.setattr(laqc_spectrum, "gaussian_backend", None)
+
+    return home
@@ -0,0 +1,44 @@
+"""Synthetic Gaussian logs for the tests of the parsers."""
+import bz2
+import gzip
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression of a log by its suffix (see laqc_spectrum.COMPRESSED_SUFFIXES)
+COMPRESSORS = {"": bytes, ".gz": gzip.compress, ".xz": lzma.compress, ".bz2": bz2.compress}
+if zstandard is not None:
+    COMPRESSORS[".zst"] = zstandard.ZstdCompressor().compress
+
+NORMAL = b" Normal termination of Gaussian 16 at Thu Jan  1 00:00:00 2020.\n"
+ERROR_L914 = b" Error termination via Lnk1e in /opt/g16/l914.exe at Thu Jan  1 00:00:00 2020.\n"
+
+# (wavelength, strength) of the states of the tests
+STATES = [(430.31, 0.3709), (507.84, 0.4712)]
+
+
+def l914_section(states, install="/opt/g16/", leave=True):
+    """Text of an l914 section with (wavelength, strength) [states]."""
+    lines = [b" Link1:  Proceeding to internal job step number  2.\n",
+             b" (Enter " + install.encode() + b"l914.exe)\n",
+             b" Excitation energies and oscillator strengths:\n"]
+    for k, (wavelength, strength) in enumerate(states, 1):
+        lines.append(f" Excited State {k:3d}:      Singlet-A      {1239.84 / wavelength:.4f} eV "
+                     f"{wavelength:7.2f} nm  f={strength:.4f}  <S**2>=0.000\n".encode())
+        lines.append(f"      {9 + k} -> 12         0.70000\n".encode())
+        lines.append(f"      {9 + k} <- 12        -0.10000\n".encode())
+    if leave:
+        lines.append(b" Leave Link  914 at Thu Jan  1 00:00:00 2020, MaxMem=  1 cpu: 1.0\n")
+
+    return b"".join(lines)
+
+
+def write_log(path, content):
+    """Write [content] to the file [path] and return its name."""
+    with open(path, "wb") as f_log:
+        f_log.write(content)
+
+    return str(path)
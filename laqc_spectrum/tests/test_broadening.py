@@ -0,0 +1,198 @@
+"""Broadening engines of laqc_spectrum against the scalar reference (broaden_gaussian_scalar)."""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import laqc_spectrum
+
+
+@pytest.fixture
+def ensemble():
+    """Small ensemble with an empty structure, on a grid that covers all the states."""
+    rng = np.random.default_rng(0)
+    counts = np.array([3, 0, 5, 1, 4], dtype=np.int64)
+    wavelengths = rng.uniform(250.0, 600.0, counts.sum())
+    strengths = rng.uniform(0.0, 1.0, counts.sum())
+    wave_numbers = np.arange(200.0, 700.0, 2.5)
+
+    return counts, wavelengths, strengths, wave_numbers
+
+
+@pytest.fixture(params=list(laqc_spectrum.GAUSSIAN_BACKENDS))
+def backend(request):
+    """Each installed backend, forced for the test (select_backend)."""
+    return laqc_spectrum.select_backend(request.param)
+
+
+@pytest.mark.parametrize("max_bytes", [laqc_spectrum.MAX_BROADEN_BYTES, 2**10])
+def test_broaden_gaussian_scalar(ensemble, max_bytes):
+    laqc_spectrum.select_backend("numpy")
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian(*ensemble, max_bytes=max_bytes)
+
+    assert spectra.shape == reference.shape
+    np.testing.assert_allclose(spectra, reference, rtol=1e-12, atol=1e-12 * reference.max())
+    assert not spectra[1].any()
+
+
+@pytest.mark.parametrize("cutoff", [2.0, 4.0])
+def test_broaden_gaussian_window(ensemble, cutoff):
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian_window(*ensemble, cutoff, max_bytes=2**10)
+
+    # Each term is off by at most the bound of the peak of its transition (below the
+    # highest value of the spectrum, the strengths are positive)
+    bound = laqc_spectrum.truncation_error_bound(cutoff)
+    np.testing.assert_array_less(np.abs(spectra - reference).max(axis=1),
+                                 bound * ensemble[0] * reference.max(axis=1) + 1e-12)
+    assert not spectra[1].any()
+
+
+def test_fit_gaussian_ignored_options(ensemble, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    counts, wavelengths, strengths, wave_numbers = ensemble
+    laqc_spectrum.save_input_npz(laqc_spectrum.INPUT_NPZ, [str(k) for k in range(len(counts))],
+                                 counts, wavelengths, strengths)
+
+    laqc_spectrum.fit_gaussian("aritmética", wave_numbers, cutoff=3.0, threads=2, mode="table")
+    assert "threads=2, mode=table só no cálculo direto" in capsys.readouterr().out
+
+
+def test_broaden_gaussian_fft(ensemble):
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian_fft(*ensemble, max_bytes=2**12)
+
+    assert spectra.shape == reference.shape
+    np.testing.assert_allclose(spectra, reference, rtol=0, atol=1e-3 * reference.max())
+    assert not spectra[1].any()
+
+
+def test_broaden_lorentzian_fft(ensemble):
+    direct = laqc_spectrum.broaden_line_shape("lorentzian", *ensemble)
+    spectra = laqc_spectrum.broaden_line_shape("lorentzian", *ensemble, engine="fft")
+
+    np.testing.assert_allclose(spectra, direct, rtol=0, atol=1e-3 * direct.max())
+
+
+@pytest.mark.parametrize("name", list(laqc_spectrum.LINE_SHAPES))
+def test_line_shape_registry(name):
+    shape = laqc_spectrum.LINE_SHAPES[name]
+    params = laqc_spectrum.line_shape_params(name)
+    assert params == {param: spec["default"] for param, spec in shape["params"].items()}
+
+    # Profile of area 1, with half of its maximum at the half width
+    step = 1e-3
+    distance = np.arange(-400.0, 400.0, step)
+    profile = shape["profile"](distance.copy(), **params)
+    assert abs(profile.sum() * step - 1.0) < 2e-3
+    half_width = shape["half_width"](**params)
+    peak, half = shape["profile"](np.array([0.0, half_width]), **params)
+    assert half == pytest.approx(peak / 2, rel=1e-3)
+
+
+def test_line_shape_params():
+    assert laqc_spectrum.line_shape_params("voigt", {"width": 0.2, "eta": 0.5}) == {
+        "width": 0.2, "hwhm": laqc_spectrum.LORENTZIAN_HWHM}
+    for name, params in (("sticks", {}), ("lorentzian", {"hwhm": 0.0}),
+                         ("pseudo_voigt", {"eta": 1.5})):
+        with pytest.raises(ValueError):
+            laqc_spectrum.line_shape_params(name, params)
+
+
+@pytest.mark.parametrize("name", ["voigt", "pseudo_voigt"])
+def test_broaden_line_shape_fft(ensemble, name):
+    direct = laqc_spectrum.broaden_line_shape(name, *ensemble, threads=2)
+    spectra = laqc_spectrum.broaden_line_shape(name, *ensemble, engine="fft")
+
+    np.testing.assert_allclose(spectra, direct, rtol=0, atol=1e-3 * direct.max())
+    assert not direct[1].any()
+
+
+def test_broaden_line_shape_limits(ensemble):
+    # The registry gaussian is fit_gaussian; a pseudo-Voigt with eta=1 is the lorentzian
+    np.testing.assert_array_equal(laqc_spectrum.broaden_line_shape("gaussian", *ensemble),
+                                  laqc_spectrum.broaden_gaussian(*ensemble))
+    lorentzian = laqc_spectrum.broaden_line_shape("lorentzian", *ensemble)
+    np.testing.assert_allclose(laqc_spectrum.broaden_line_shape("pseudo_voigt", *ensemble,
+                                                                {"eta": 1.0}),
+                               lorentzian, rtol=1e-12, atol=1e-12 * lorentzian.max())
+
+
+def test_broaden_gaussian_backend(ensemble, backend):
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian(*ensemble, max_bytes=2**12)
+
+    np.testing.assert_allclose(spectra, reference, rtol=1e-12, atol=1e-12 * reference.max())
+    assert laqc_spectrum.gaussian_backend == backend
+
+
+def test_select_backend(monkeypatch):
+    with pytest.raises(ValueError):
+        laqc_spectrum.select_backend("fortran")
+    monkeypatch.setenv(laqc_spectrum.BACKEND_ENV, "numpy")
+    assert laqc_spectrum.select_backend() == "numpy"
+    monkeypatch.delenv(laqc_spectrum.BACKEND_ENV)
+
+    # The calibrated choice is kept in the (temporary) home and used by a new process
+    monkeypatch.setattr(laqc_spectrum, "gaussian_backend", None)
+    chosen = laqc_spectrum.select_backend("auto")
+    assert chosen in laqc_spectrum.GAUSSIAN_BACKENDS
+    monkeypatch.setattr(laqc_spectrum, "gaussian_backend", None)
+    monkeypatch.setattr(laqc_spectrum, "calibrate_backends", lambda: pytest.fail("calibrated again"))
+    if len(laqc_spectrum.GAUSSIAN_BACKENDS) > 1:
+        assert (Path.home() / laqc_spectrum.BACKEND_FILE).exists()
+    assert laqc_spectrum.select_backend() == chosen
+
+
+@pytest.mark.parametrize("threads", [2, 3, None])
+def test_broaden_gaussian_threads(ensemble, backend, threads):
+    serial = laqc_spectrum.broaden_gaussian(*ensemble, max_bytes=2**10)
+    spectra = laqc_spectrum.broaden_gaussian(*ensemble, max_bytes=2**10, threads=threads)
+
+    # The tiles are the same, only the threads that compute them change
+    np.testing.assert_allclose(spectra, serial, rtol=1e-14, atol=1e-14 * serial.max())
+
+
+def test_broaden_gaussian_float32(ensemble, backend):
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian(*ensemble, dtype=np.float32)
+
+    assert spectra.dtype == np.float32
+    np.testing.assert_allclose(spectra, reference, rtol=0, atol=1e-6 * reference.max())
+
+    deviation = laqc_spectrum.float32_deviation(*ensemble, spectra,
+                                                laqc_spectrum.pairwise_sum(spectra) / len(spectra))
+    assert deviation["spectra"] < 1e-6
+    assert deviation["average"] < 1e-6
+
+
+def test_pairwise_sum():
+    rng = np.random.default_rng(1)
+    spectra = rng.uniform(0.0, 1.0, (1000, 7)).astype(np.float32)
+    original = spectra.copy()
+    reference = spectra.astype(np.float64).sum(axis=0)
+
+    # In a single block and in blocks of a few rows
+    for max_bytes in (laqc_spectrum.MAX_BROADEN_BYTES, 3 * spectra[0].nbytes):
+        total = laqc_spectrum.pairwise_sum(spectra, max_bytes)
+        assert total.dtype == np.float32
+        np.testing.assert_allclose(total, reference, rtol=10 * np.finfo(np.float32).eps)
+    np.testing.assert_array_equal(spectra, original)
+    assert laqc_spectrum.pairwise_sum(spectra[:0]).shape == (7,)
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_broaden_gaussian_table(ensemble, threads):
+    counts, wavelengths, strengths, wave_numbers = ensemble
+    reference = laqc_spectrum.broaden_gaussian_scalar(*ensemble)
+    spectra = laqc_spectrum.broaden_gaussian(*ensemble, max_bytes=2**10, threads=threads,
+                                             mode="table")
+
+    # Error of each line bounded relative to its peak (table_error_bound)
+    _, weights = laqc_spectrum.gaussian_parameters(strengths)
+    peaks = np.add.reduceat(weights, laqc_spectrum.structure_offsets(counts)[:-1])
+    peaks[counts == 0] = 0.0
+    bound = laqc_spectrum.table_error_bound() * peaks[:, np.newaxis]
+    assert np.all(np.abs(spectra - reference) <= bound + 1e-12 * reference.max())
+    assert laqc_spectrum.fast_gaussian_mode() in laqc_spectrum.GAUSSIAN_MODES
@@ -0,0 +1,50 @@
+"""Persistent cache of the parsed files (ParseCache, open_cache)."""
+import numpy as np
+
+import laqc_spectrum
+from gaussian_logs import NORMAL, STATES, l914_section, write_log
+
+
+def test_cache(tmp_path):
+    local_log = write_log(tmp_path / "cached.log", l914_section(STATES) + NORMAL)
+
+    cache = laqc_spectrum.open_cache(str(tmp_path), use_hash=True)
+    first = laqc_spectrum.extract_excited_states([local_log], workers=1, cache=cache)
+    cache.close()
+    cache = laqc_spectrum.open_cache(str(tmp_path), use_hash=True)
+    assert cache.get(local_log, laqc_spectrum.parse_gaussian) is not None
+    second = laqc_spectrum.extract_excited_states([local_log], workers=1, cache=cache)
+    cache.close()
+    np.testing.assert_array_equal(first[0][0], second[0][0])
+    assert second[0][2]
+
+
+def test_cache_changed_file(tmp_path):
+    local_log = write_log(tmp_path / "changed.log", l914_section(STATES) + NORMAL)
+    cache = laqc_spectrum.open_cache(str(tmp_path))
+    laqc_spectrum.extract_excited_states([local_log], workers=1, cache=cache)
+    cache.close()
+
+    write_log(local_log, l914_section(STATES[:1]) + NORMAL + b"\n")
+    cache = laqc_spectrum.open_cache(str(tmp_path))
+    assert cache.get(local_log, laqc_spectrum.parse_gaussian) is None
+    cache.close()
+
+
+def test_cache_parser_version(tmp_path):
+    local_log = write_log(tmp_path / "version.log", l914_section(STATES) + NORMAL)
+    cache = laqc_spectrum.open_cache(str(tmp_path))
+    laqc_spectrum.extract_excited_states([local_log], workers=1, cache=cache)
+
+    # Records of another version of the parsers are not used
+    cache.connection.execute("UPDATE parsed SET parser = ?", ("parse_gaussian@0",))
+    assert cache.get(local_log, laqc_spectrum.parse_gaussian) is None
+    cache.close()
+
+
+def test_cache_unusable(tmp_path, capsys):
+    (tmp_path / laqc_spectrum.CACHE_FILE).write_bytes(b"not a database" * 100)
+
+    assert laqc_spectrum.open_cache(str(tmp_path)) is None
+    assert laqc_spectrum.open_cache(str(tmp_path / "missing")) is None
+    assert "sem cache" in capsys.readouterr().out
@@ -0,0 +1,51 @@
+"""Search of the output files (get_files with os.scandir)."""
+import os
+
+import pytest
+
+import laqc_spectrum
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Directory with logs at the top, in runs and in a skipped directory."""
+    for name in ("a.log", "b.log.gz", "notes.txt", "c.out",
+                 "run_1/frame_1.log", "run_1/frame_2.log.xz", "run_2/frame_1.log",
+                 "run_2/scratch/tmp.log", "old/x.log"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+    (tmp_path / "dir.log").mkdir()
+
+    return tmp_path
+
+
+@pytest.mark.parametrize("walkers", [1, 4])
+def test_get_files(tree, walkers):
+    local = str(tree) + os.sep
+
+    assert laqc_spectrum.get_files(local, ".log", walkers=walkers) == ["a.log", "b.log.gz"]
+    assert laqc_spectrum.get_files(local, ".out", walkers=walkers) == ["c.out"]
+    assert laqc_spectrum.get_files(local, ".log", recursive=True, walkers=walkers) == [
+        "a.log", "b.log.gz", "old/x.log", "run_1/frame_1.log", "run_1/frame_2.log.xz",
+        "run_2/frame_1.log", "run_2/scratch/tmp.log"]
+    assert laqc_spectrum.get_files(local, ".log", recursive=True, include=["run_*/frame_*"],
+                                   exclude=["run_2"], walkers=walkers) == [
+        "run_1/frame_1.log", "run_1/frame_2.log.xz"]
+    assert laqc_spectrum.get_files(local, ".log", recursive=True,
+                                   exclude=["old", "scratch", "*.gz"], walkers=walkers) == [
+        "a.log", "run_1/frame_1.log", "run_1/frame_2.log.xz", "run_2/frame_1.log"]
+
+
+def test_get_files_symlinks(tree):
+    try:
+        os.symlink(tree / "a.log", tree / "link.log")
+        os.symlink(tree / "missing.log", tree / "broken.log")
+        os.symlink(tree / "run_1", tree / "run_link", target_is_directory=True)
+    except (OSError, NotImplementedError):
+        pytest.skip("symbolic links are not available")
+
+    # Links to files are returned, broken links and links to directories are not followed
+    assert laqc_spectrum.get_files(str(tree), ".log", recursive=True,
+                                   exclude=["run_1", "run_2", "old"]) == [
+        "a.log", "b.log.gz", "link.log"]
@@ -0,0 +1,77 @@
+"""Files of the extracted excited states (input.npz and input.dat)."""
+import os
+
+import numpy as np
+
+import laqc_spectrum
+
+NAMES = ["a.log", "b.log", "c.log"]
+COUNTS = np.array([2, 0, 1])
+WAVELENGTHS = np.array([430.31, 507.84, 350.0])
+STRENGTHS = np.array([0.3709, 0.4712, 0.1])
+
+
+def test_load_input_newer_file(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    laqc_spectrum.save_input(NAMES, COUNTS, [WAVELENGTHS[:2], WAVELENGTHS[:0], WAVELENGTHS[2:]],
+                             [STRENGTHS[:2], STRENGTHS[:0], STRENGTHS[2:]], text_input=True)
+
+    # input.dat written with input.npz: the npz is used
+    names, counts, wavelengths, _ = laqc_spectrum.load_input()
+    assert names == NAMES
+    np.testing.assert_array_equal(counts, COUNTS)
+    np.testing.assert_allclose(wavelengths, WAVELENGTHS)
+
+    # input.dat edited after the extraction: the dat is used, with a warning
+    with open(laqc_spectrum.INPUT_DAT, "w") as f_input:
+        f_input.write("1\n1\n400.0  0.5\n")
+    stat = os.stat(laqc_spectrum.INPUT_NPZ)
+    os.utime(laqc_spectrum.INPUT_DAT, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    _, counts, wavelengths, strengths = laqc_spectrum.load_input()
+    np.testing.assert_array_equal(counts, [1])
+    np.testing.assert_allclose(wavelengths, [400.0])
+    np.testing.assert_allclose(strengths, [0.5])
+    assert "mais recente" in capsys.readouterr().out
+
+    # A new extraction replaces both
+    writer = laqc_spectrum.InputWriter(text_input=True)
+    writer.add("d.log", WAVELENGTHS[2:], STRENGTHS[2:])
+    writer.close()
+    assert laqc_spectrum.load_input()[0] == ["d.log"]
+
+
+def test_npz_round_trip(tmp_path):
+    file_name = str(tmp_path / "input.npz")
+    laqc_spectrum.save_input_npz(file_name, NAMES, COUNTS, WAVELENGTHS, STRENGTHS)
+
+    names, counts, wavelengths, strengths = laqc_spectrum.load_input_npz(file_name)
+    assert names == NAMES
+    np.testing.assert_array_equal(counts, COUNTS)
+    np.testing.assert_array_equal(wavelengths, WAVELENGTHS)
+    np.testing.assert_array_equal(strengths, STRENGTHS)
+
+
+def test_dat_round_trip(tmp_path):
+    file_name = str(tmp_path / "input.dat")
+    for with_names in (False, True):
+        laqc_spectrum.export_input_dat(file_name, NAMES, COUNTS, WAVELENGTHS, STRENGTHS, with_names)
+
+        names, counts, wavelengths, strengths = laqc_spectrum.load_input_dat(file_name)
+        assert names == (NAMES if with_names else ["1", "2", "3"])
+        np.testing.assert_array_equal(counts, COUNTS)
+        np.testing.assert_array_equal(wavelengths, WAVELENGTHS)
+        np.testing.assert_array_equal(strengths, STRENGTHS)
+
+
+def test_legacy_windows_input(tmp_path, monkeypatch):
+    # input.dat of the old window version: CRLF, padded count, line of names
+    monkeypatch.chdir(tmp_path)
+    with open(laqc_spectrum.INPUT_DAT, "wb") as f_input:
+        f_input.write(b"3   \r\n2 0 1\r\na.log b.log c.log\r\n"
+                      b"430.31  0.3709\r\n507.84  0.4712\r\n350.0  0.1\r\n")
+
+    names, counts, wavelengths, strengths = laqc_spectrum.load_input()
+    assert names == NAMES
+    np.testing.assert_array_equal(counts, COUNTS)
+    np.testing.assert_array_equal(wavelengths, WAVELENGTHS)
+    np.testing.assert_array_equal(strengths, STRENGTHS)
@@ -0,0 +1,94 @@
+"""Parsers of the Orca outputs: absorption tables and their cache."""
+import gzip
+
+import numpy as np
+import pytest
+
+import laqc_spectrum
+from gaussian_logs import write_log
+
+# (state, energy in cm-1, wavelength in nm, strength) of the tables of the tests
+ELECTRIC = [(1, 21456.1, 466.1, 0.0123), (2, 25000.0, 400.0, 0.1)]
+VELOCITY = [(1, 21456.1, 466.1, 0.0119), (2, 25000.0, 400.0, 0.0987)]
+LINE = b"-" * 77 + b"\n"
+
+
+def orca_section(title, rows, orca6=False):
+    """Text of an absorption table of Orca 4/5 (or Orca 6) with [rows]."""
+    lines = [LINE, b"         " + title + b"\n", LINE,
+             b"State   Energy    Wavelength  fosc         T2        TX        TY        TZ\n",
+             b"        (cm-1)      (nm)                 (au**2)    (au)      (au)      (au)\n",
+             LINE]
+    for state, energy, wavelength, strength in rows:
+        if orca6:
+            lines.append(f"  0-1A  ->  {state}-1A    {energy / 8065.54:.6f}   {energy:.1f}   "
+                         f"{wavelength:.1f}   {strength:.9f}   0.18873   0.43443   0.0   0.0\n".encode())
+        else:
+            lines.append(f"   {state}   {energy:.1f}    {wavelength:.1f}   {strength:.9f}   "
+                         f"0.18873   0.43443   0.00000   0.00000\n".encode())
+    lines.append(b"\n")
+
+    return b"".join(lines)
+
+
+def orca_output(orca6=False):
+    """Text of an Orca output with the tables via electric and velocity dipole moments."""
+    return (b"                                 * O   R   C   A *\n"
+            + orca_section(b"ABSORPTION SPECTRUM VIA TRANSITION ELECTRIC DIPOLE MOMENTS", ELECTRIC,
+                           orca6)
+            + orca_section(b"ABSORPTION SPECTRUM VIA TRANSITION VELOCITY DIPOLE MOMENTS", VELOCITY,
+                           orca6)
+            + b"                             ****ORCA TERMINATED NORMALLY****\n")
+
+
+@pytest.mark.parametrize("orca6", [False, True])
+def test_orca_sections(tmp_path, orca6):
+    local_log = write_log(tmp_path / "mol.out", orca_output(orca6))
+
+    sections = laqc_spectrum.read_orca_spectra(local_log)
+    assert sorted(sections) == ["electric", "velocity"]
+    for name, rows in (("electric", ELECTRIC), ("velocity", VELOCITY)):
+        np.testing.assert_array_equal(sections[name]["state"], [row[0] for row in rows])
+        np.testing.assert_allclose(sections[name]["wavelength"], [row[2] for row in rows])
+        np.testing.assert_allclose(sections[name]["strength"], [row[3] for row in rows])
+
+    wavelengths, strengths, _ = laqc_spectrum.parse_orca_out(local_log, "velocity")
+    np.testing.assert_allclose(wavelengths, [466.1, 400.0])
+    np.testing.assert_allclose(strengths, [0.0119, 0.0987])
+    assert len(laqc_spectrum.parse_orca_out(local_log, "soc_electric")[0]) == 0
+
+
+def test_orca_soc_and_last_table(tmp_path):
+    content = (orca_output()
+               + orca_section(b"ABSORPTION SPECTRUM VIA TRANSITION ELECTRIC DIPOLE MOMENTS",
+                              ELECTRIC[:1])
+               + orca_section(b"SOC CORRECTED ABSORPTION SPECTRUM VIA TRANSITION ELECTRIC DIPOLE "
+                              b"MOMENTS", [(3, 20000.0, 500.0, 0.05)]))
+    local_log = write_log(tmp_path / "mol.out.gz", gzip.compress(content))
+
+    sections = laqc_spectrum.read_orca_spectra(local_log)
+    np.testing.assert_allclose(sections["electric"]["wavelength"], [466.1])
+    np.testing.assert_allclose(sections["soc_electric"]["wavelength"], [500.0])
+
+
+def test_orca_cache_representations(tmp_path, monkeypatch):
+    list_log = [write_log(tmp_path / f"mol{k}.out", orca_output()) for k in range(3)]
+    read = []
+    read_orca_spectra = laqc_spectrum.read_orca_spectra
+    monkeypatch.setattr(laqc_spectrum, "read_orca_spectra",
+                        lambda local_log: read.append(local_log) or read_orca_spectra(local_log))
+
+    cache = laqc_spectrum.open_cache(str(tmp_path))
+    first = laqc_spectrum.extract_orca_states(list_log, "electric", workers=1, cache=cache)
+    cache.close()
+    assert read == list_log
+    np.testing.assert_allclose(first[0][1], [0.0123, 0.1])
+
+    # Another representation comes from the cache: the outputs are not read again
+    cache = laqc_spectrum.open_cache(str(tmp_path))
+    second = laqc_spectrum.extract_orca_states(list_log, "velocity", workers=1, cache=cache)
+    cache.close()
+    assert read == list_log
+    for wavelengths, strengths, _ in second:
+        np.testing.assert_allclose(wavelengths, [466.1, 400.0])
+        np.testing.assert_allclose(strengths, [0.0119, 0.0987])
@@ -0,0 +1,131 @@
+"""Parsers of the Gaussian logs: termination status of plain, compressed and truncated files."""
+import io
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+import laqc_spectrum
+from gaussian_logs import COMPRESSORS, ERROR_L914, NORMAL, STATES, l914_section, write_log
+
+
+@pytest.mark.parametrize("suffix", list(COMPRESSORS))
+def test_normal_job(tmp_path, suffix):
+    content = b" Gaussian 16\n" + l914_section(STATES) + NORMAL
+    local_log = write_log(tmp_path / f"normal.log{suffix}", COMPRESSORS[suffix](content))
+
+    wavelengths, strengths, founded = laqc_spectrum.parse_gaussian(local_log)
+    np.testing.assert_allclose(wavelengths, [430.31, 507.84])
+    np.testing.assert_allclose(strengths, [0.3709, 0.4712])
+    assert founded
+    assert laqc_spectrum.normal_termination(local_log)
+
+
+@pytest.mark.parametrize("suffix", list(COMPRESSORS))
+def test_link1_died_in_l914(tmp_path, suffix):
+    # First step ended normally, the TD step died inside l914 (section left open)
+    content = b" Gaussian 16\n" + NORMAL + l914_section(STATES[:1], leave=False) + ERROR_L914
+    local_log = write_log(tmp_path / f"died.log{suffix}", COMPRESSORS[suffix](content))
+
+    assert not laqc_spectrum.parse_gaussian(local_log)[2]
+    assert not laqc_spectrum.normal_termination(local_log)
+
+
+@pytest.mark.parametrize("suffix", [suffix for suffix in COMPRESSORS if suffix])
+def test_truncated_log(tmp_path, suffix):
+    # Compressed log still being written: the stream ends before its end
+    compressed = COMPRESSORS[suffix](l914_section(STATES) * 200 + NORMAL)
+    local_log = write_log(tmp_path / f"partial.log{suffix}", compressed[:len(compressed) // 2])
+
+    assert not laqc_spectrum.parse_gaussian(local_log)[2]
+    assert not laqc_spectrum.normal_termination(local_log)
+
+
+def test_truncated_archive(tmp_path, capsys):
+    # Archive cut inside its second member: the first one is kept
+    archive = tmp_path / "ensemble.tar"
+    with tarfile.open(archive, "w") as f_tar:
+        for name in ("first.log", "second.log"):
+            content = l914_section(STATES) * 50 + NORMAL
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            f_tar.addfile(info, io.BytesIO(content))
+    data = archive.read_bytes()
+    archive.write_bytes(data[:len(data) * 3 // 4])
+
+    names, results = laqc_spectrum.read_archive(str(archive), ".log",
+                                                laqc_spectrum.parse_gaussian_stream)
+    assert names == ["first.log"]
+    assert results[0][2]
+    np.testing.assert_allclose(results[0][0], [430.31, 507.84])
+    assert "incompleto" in capsys.readouterr().out
+
+
+def archive_members():
+    """Members of the archives of the tests: a good log, a compressed failed log and a note."""
+    return {"good.log": l914_section(STATES) + NORMAL,
+            "died.log.gz": COMPRESSORS[".gz"](NORMAL + l914_section(STATES[:1], leave=False)
+                                              + ERROR_L914),
+            "notes.txt": b"not a log\n"}
+
+
+@pytest.mark.parametrize("name", ["ensemble.tar.gz", "ensemble.zip"])
+def test_archive_members(tmp_path, name):
+    archive = str(tmp_path / name)
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(archive, "w") as f_zip:
+            for member, content in archive_members().items():
+                f_zip.writestr(member, content)
+    else:
+        with tarfile.open(archive, "w:gz") as f_tar:
+            for member, content in archive_members().items():
+                info = tarfile.TarInfo(member)
+                info.size = len(content)
+                f_tar.addfile(info, io.BytesIO(content))
+
+    assert laqc_spectrum.is_archive(archive)
+    names, results = laqc_spectrum.read_archive(archive, ".log", laqc_spectrum.parse_gaussian_stream)
+    assert names == ["good.log", "died.log.gz"]
+    assert [founded for _, _, founded in results] == [True, False]
+    np.testing.assert_allclose(results[0][0], [430.31, 507.84])
+
+
+@pytest.mark.parametrize("install", ["/opt/g16/", "/scr/programs/g09/", "C:\\G16W\\"])
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_l914_install_path(tmp_path, install, suffix):
+    content = l914_section(STATES, install) + NORMAL
+    local_log = write_log(tmp_path / f"path.log{suffix}", COMPRESSORS[suffix](content))
+
+    np.testing.assert_allclose(laqc_spectrum.parse_gaussian(local_log)[0], [430.31, 507.84])
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_last_l914_section(tmp_path, suffix):
+    content = l914_section(STATES) + l914_section([(350.0, 0.1)]) + NORMAL
+    local_log = write_log(tmp_path / f"multi.log{suffix}", COMPRESSORS[suffix](content))
+
+    wavelengths, strengths, founded = laqc_spectrum.parse_gaussian(local_log)
+    np.testing.assert_allclose(wavelengths, [350.0])
+    np.testing.assert_allclose(strengths, [0.1])
+    assert founded
+
+
+@pytest.mark.parametrize("suffix", [suffix for suffix in ("", ".gz", ".zst") if suffix in COMPRESSORS])
+def test_read_transitions(tmp_path, suffix):
+    content = l914_section(STATES) + l914_section(STATES * 20) + NORMAL
+    local_log = write_log(tmp_path / f"states.log{suffix}", COMPRESSORS[suffix](content))
+
+    states = laqc_spectrum.parse_gaussian_states(local_log)
+    assert len(states) == 40
+    np.testing.assert_allclose(states["wavelength"][:2], [430.31, 507.84])
+
+    # Several states in one pass, in any order; one state alone
+    offsets = states["offset"][[30, 2, 39, 2]]
+    transitions = laqc_spectrum.read_transitions(local_log, offsets)
+    for k, state in zip([30, 2, 39, 2], transitions):
+        assert state["occupied"].tolist() == [str(k + 10), str(k + 10)]
+        assert state["direction"].tolist() == ["->", "<-"]
+        np.testing.assert_allclose(state["coefficient"], [0.7, -0.1])
+    single = laqc_spectrum.read_transitions(local_log, states["offset"][0])
+    assert single["occupied"].tolist() == ["10", "10"]
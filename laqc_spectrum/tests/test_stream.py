@@ -0,0 +1,37 @@
+"""Streaming mode (--stream): same files as the extraction followed by fit_gaussian."""
+import numpy as np
+
+import laqc_spectrum
+from gaussian_logs import COMPRESSORS, ERROR_L914, NORMAL, STATES, l914_section, write_log
+
+FILES = ("spectrum_gaussian.dat", "average_spectrum.dat", "dados_spectrum.txt", "medias.txt")
+
+
+def test_stream_equals_batch(tmp_path, monkeypatch):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    write_log(logs / "a.log", l914_section(STATES) + NORMAL)
+    write_log(logs / "b.log.gz", COMPRESSORS[".gz"](l914_section([(350.0, 0.1)]) + NORMAL))
+    write_log(logs / "c.log", l914_section(STATES[1:] + [(610.5, 0.02)]) + NORMAL)
+    write_log(logs / "died.log", NORMAL + l914_section(STATES[:1], leave=False) + ERROR_L914)
+    monkeypatch.setattr("builtins.input", lambda prompt="": str(logs) + "/")
+    wave_numbers = np.arange(200, 701, 2.5)
+
+    (tmp_path / "batch").mkdir()
+    monkeypatch.chdir(tmp_path / "batch")
+    laqc_spectrum.extract_data_gaussian(workers=1, use_cache=False)
+    laqc_spectrum.fit_gaussian("aritmética", wave_numbers)
+
+    (tmp_path / "stream").mkdir()
+    monkeypatch.chdir(tmp_path / "stream")
+    laqc_spectrum.stream_data_gaussian("aritmética", wave_numbers, workers=1, use_cache=False)
+
+    batch = laqc_spectrum.load_input_npz(tmp_path / "batch" / laqc_spectrum.INPUT_NPZ)
+    stream = laqc_spectrum.load_input_npz(tmp_path / "stream" / laqc_spectrum.INPUT_NPZ)
+    assert batch[0] == stream[0] == ["a.log", "b.log.gz", "c.log"]
+    for batch_values, stream_values in zip(batch[1:], stream[1:]):
+        np.testing.assert_array_equal(batch_values, stream_values)
+
+    for file_name in FILES:
+        assert ((tmp_path / "stream" / file_name).read_text()
+                == (tmp_path / "batch" / file_name).read_text()), file_name
@@ -0,0 +1,54 @@
+"""Watch mode (watch_directory): logs that fail, change or can not be read yet."""
+import gzip
+
+import numpy as np
+
+import laqc_spectrum
+from gaussian_logs import ERROR_L914, NORMAL, STATES, l914_section, write_log
+
+
+def test_watch_directory(tmp_path, monkeypatch):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    monkeypatch.chdir(tmp_path)
+    write_log(logs / "good.log", l914_section(STATES) + NORMAL)
+    write_log(logs / "died.log", NORMAL + l914_section(STATES[:1], leave=False) + ERROR_L914)
+    # Compressed log still being written (stream without its end)
+    write_log(logs / "partial.log.gz", gzip.compress(l914_section(STATES) + NORMAL)[:-12])
+
+    verified = []
+    normal_termination = laqc_spectrum.normal_termination
+
+    def counted(local_log):
+        verified.append(local_log)
+        return normal_termination(local_log)
+
+    monkeypatch.setattr(laqc_spectrum, "normal_termination", counted)
+    wave_numbers = np.arange(300.0, 600.0, 10.0)
+    m_valor = laqc_spectrum.watch_directory(str(logs), wave_numbers, interval=0, use_cache=False,
+                                            cycles=2)
+
+    assert m_valor == 1
+    # The failed log is verified only once, while it does not change
+    assert sum(log.endswith("died.log") for log in verified) == 1
+    average = np.loadtxt("average_spectrum.dat")
+    np.testing.assert_allclose(average[:, 1], laqc_spectrum.spectrum_gaussian_structure(
+        [w for w, _ in STATES], [f for _, f in STATES], wave_numbers), rtol=1e-9)
+
+
+def test_watch_removed_log(tmp_path, monkeypatch):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    monkeypatch.chdir(tmp_path)
+    write_log(logs / "good.log", l914_section(STATES) + NORMAL)
+    write_log(logs / "removed.log", l914_section(STATES) + NORMAL)
+
+    # The log is removed between the listing and the reading
+    def removed(local_log):
+        if local_log.endswith("removed.log"):
+            raise FileNotFoundError(local_log)
+        return True
+
+    monkeypatch.setattr(laqc_spectrum, "normal_termination", removed)
+    assert laqc_spectrum.watch_directory(str(logs), np.arange(300.0, 600.0, 10.0), interval=0,
+                                         use_cache=False, cycles=1) == 1